@@ -6,6 +6,15 @@
 # an initial (or start) state q0 ∈ Q  
 # a set of accepting (or final) states F ⊆ Q  
 
+import codecs
+import heapq
+import io
+import mmap
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from types import MappingProxyType
+
 class NFAError(Exception): # exception is a class that all built-in Python errors (like ValueError, TypeError) inherit from.
     pass                   # defining a custom error that behaves like a normal Python exception with subclasses that 
                            # help categorize different types of NFA errors
@@ -37,6 +46,10 @@ class InputStringError(Exception):
     # raised when there isn't an error with the NFA, but with the input string fed into it (it contains characters not present in the NFA's alphabet)
     pass
 
+class RegexError(Exception):
+    # raised when a regular expression given to convertRegextoNFA can't be parsed (unmatched parenthesis, nothing to repeat, ...)
+    pass
+
 # duplicate rule error seen in NFA's no longer found - the NFA transition function allow for multiple destination states for the same source state and symbol
 
 def isComment(string):
@@ -50,6 +63,25 @@ def stringWithoutComments(string):
 def isEmptyLine(string):
     return string == ""
 
+def splitRuleLine(line):
+    # splits "sourceState, symbol, destinationState" on the commas outside curly brackets, so states named
+    # after subsets of states (e.g. {q0, q1}, as written for a DFA by convertNFAtoDFA) can be read back
+    if "{" not in line:
+        return line.split(",")
+    parts = []
+    depth = 0
+    partStartIndex = 0
+    for index, character in enumerate(line):
+        if character == "{":
+            depth += 1
+        elif character == "}":
+            depth -= 1
+        elif character == "," and depth == 0:
+            parts.append(line[partStartIndex:index])
+            partStartIndex = index + 1
+    parts.append(line[partStartIndex:])
+    return parts
+
 def fixUtf8Corruption(possiblyCorruptedString):
     try:
         # attempt to fix the corrupted string:
@@ -67,7 +99,9 @@ def fixUtf8Corruption(possiblyCorruptedString):
         return possiblyCorruptedString  # return the original string if no fix was possible
 
 def parseFile(inputNfaFile):
-    lines = inputNfaFile.readlines()
+    # single pass over the file - lines are read one at a time from the (buffered) file object, not all at once
+    # with readlines(), and the common cases (rule lines without comments or non-ASCII symbols) take the
+    # shortest path through the loop
     currentSection = "None"
     states = []
     sigma = [] # sigma = alphabet
@@ -77,64 +111,55 @@ def parseFile(inputNfaFile):
     accept = [] # a nfa can have multiple accept states
     inMultipleLineComment = False # boolean variable to allow multiple line comments starting with /* and ending with */
                                # is true if we are currently inside a multi line comment and we need to skip all lines until */
-    for line in lines:
+    for line in inputNfaFile:
         line = line.strip() # eliminating whitespace
         
         # continue statements go to next iteration (next line) and are used for readability purposes,
         # could be replaced by elif statements
         
-        if isComment(line) or isEmptyLine(line):
+        if not line or line[0] == "#": # same as isEmptyLine(line) or isComment(line), without the function calls
             continue # skipping lines that are comments
             
         if "#" in line: # filtering lines that contain comments
-            line = stringWithoutComments(line) # only text before the comment is processed 
-            line = line.strip() # eliminating possible whitespace before first "#" character
-            
-        if not inMultipleLineComment:
-            
-            if "/*" in line:
-                
-                inMultipleLineComment = True # we are inside a multiple line comment
-                # even though we are now in a multiple line comment, it can still be used as a one-liner
-                # and this needs to be checked
-                multipleLineCommentStartIndex = line.find("/*") # gives the position of the first comment opener
-                
-                if "*/" in line:
-
-                    multipleLineCommentLastStartIndex = line.rfind("/*") # more /* can be used in a line, checks for the last one
-                    multipleLineCommentLastEndIndex = line.rfind("*/") # gives the position of the last ending comment symbol
-                    
-                    if multipleLineCommentLastStartIndex < multipleLineCommentLastEndIndex:
-                        # then this is actually a one liner comment
-                        inMultipleLineComment = False
-                        line = line[:multipleLineCommentStartIndex] + line[multipleLineCommentLastEndIndex + 2:] # concatenates string before the comment and after the comment
-                        line = line.strip()
-                        # checks if there is anything to parse before and after the comment
-                        
-                else:   # not a one-liner comment - only need to check before the /* 
-                    
-                    line = line[:multipleLineCommentStartIndex] # checks if there is anything to parse before the comment
-                    line = line.strip()
-                    
-                if isEmptyLine(line):
-                    continue
-            
-            
+            line = line[:line.index("#")].strip() # only text before the comment is processed (stringWithoutComments)
             
-        elif inMultipleLineComment: # this means that it's not the first line in the comment
-                                    # elif statement ensures that the parser won't skip lines that are before the start of a multiple line comment
-                                    # for example, q1, 1, q0 /* some text - would be skipped by the continue statement if not for the elif statement
+        if inMultipleLineComment: # this means that it's not the first line in the comment
             if "*/" in line:
                 
                 multipleLineCommentEndIndex = line.rfind("*/")
-                line = line[multipleLineCommentEndIndex + 2:] # the string after the */ (is not a comment)
+                line = line[multipleLineCommentEndIndex + 2:].strip() # the string after the */ (is not a comment)
                 inMultipleLineComment = False
-                line = line.strip()
-                if isEmptyLine(line):
+                if not line:
                     continue
                 
             else:
                 continue # skip line that is completely within the multiple line comment
+
+        elif "/*" in line:
+                
+            inMultipleLineComment = True # we are inside a multiple line comment
+            # even though we are now in a multiple line comment, it can still be used as a one-liner
+            # and this needs to be checked
+            multipleLineCommentStartIndex = line.find("/*") # gives the position of the first comment opener
+            
+            if "*/" in line:
+
+                multipleLineCommentLastStartIndex = line.rfind("/*") # more /* can be used in a line, checks for the last one
+                multipleLineCommentLastEndIndex = line.rfind("*/") # gives the position of the last ending comment symbol
+                
+                if multipleLineCommentLastStartIndex < multipleLineCommentLastEndIndex:
+                    # then this is actually a one liner comment
+                    inMultipleLineComment = False
+                    line = line[:multipleLineCommentStartIndex] + line[multipleLineCommentLastEndIndex + 2:] # concatenates string before the comment and after the comment
+                    line = line.strip()
+                    # checks if there is anything to parse before and after the comment
+                    
+            else:   # not a one-liner comment - only need to check before the /* 
+                
+                line = line[:multipleLineCommentStartIndex].strip() # checks if there is anything to parse before the comment
+                
+            if not line:
+                continue
         
         if line[0] == "[": # new section starts here, filtering opening and closing pharantesis
             currentSection = line[1:-1]
@@ -143,23 +168,16 @@ def parseFile(inputNfaFile):
             currentSection = "None" # searching for new section tag ([SectionName])
             continue
         
-        if currentSection == "None":
-            continue # skipping line, still searching for section tags ([SectionName])
-        if currentSection == "States":
-            states.append(line) 
-            continue
-        if currentSection == "Sigma":
-            sigma.append(line)
-            continue 
-        if currentSection == "Rules":
-            sourceState, symbol, destinationState = line.split(",")
+        if currentSection == "Rules": # checked first - by far the most lines of a large definition are rules
+            if "{" in line:
+                sourceState, symbol, destinationState = splitRuleLine(line)
+            else:
+                sourceState, symbol, destinationState = line.split(",")
             sourceState = sourceState.strip()
             symbol = symbol.strip() 
-            symbol = fixUtf8Corruption(symbol) # fixing any possible corruption that can be caused by file in different encoding from utf-8
+            if not symbol.isascii(): # an ASCII string can't be corrupted - encoding and decoding it gives the same string
+                symbol = fixUtf8Corruption(symbol) # fixing any possible corruption that can be caused by file in different encoding from utf-8
             destinationState = destinationState.strip()
-            if sourceState not in rules:        
-                rules[sourceState] = {} # initialising with a hashmap
-                
                                                                       # a transition function 
                                                                       # δ  :  Q    ×   Σ    →  P(Q)
                                                                       #     srcSt    symbol  destStates
@@ -168,11 +186,20 @@ def parseFile(inputNfaFile):
                                    # ε looks prettier and more formal - but some older text editors without UTF-8 or 
                                    # with weirder font styles may not display it correctly
                                    # or make it too similar with an 'e'
-                                                                                             
-            if symbol not in rules[sourceState]:
-                rules[sourceState][symbol] = set() # initialising with a set
 
-            rules[sourceState][symbol].add(destinationState) # updating the hashset
+            try:
+                rules[sourceState][symbol].add(destinationState) # updating the hashset
+            except KeyError: # first rule with this source state or this (source state, symbol) pair
+                rules.setdefault(sourceState, {}).setdefault(symbol, set()).add(destinationState) # initialising with a hashmap and a set
+            continue
+        if currentSection == "None":
+            continue # skipping line, still searching for section tags ([SectionName])
+        if currentSection == "States":
+            states.append(line) 
+            continue
+        if currentSection == "Sigma":
+            sigma.append(line)
+            continue 
         if currentSection == "Start":
             start = line
             continue
@@ -183,14 +210,17 @@ def parseFile(inputNfaFile):
     inputNfaFile.close()
     
     NFA = states, sigma, rules, start, accept
-    if not isNfaValid(NFA):
-        return False 
-    else:
-        # returning 5-tuple
-        return NFA
-    
+    # returning a validated 5-tuple - validation happens once, here, and isn't repeated by the functions using it
+    return ValidatedNFA(NFA)
+
 def isNfaValid(NFA):
+    if isinstance(NFA, ValidatedNFA):
+        return True # already validated when it was created
+
     states, sigma, rules, start, accept = NFA # getting values from 5-tuple
+    # sets for the membership tests - searching in the lists would make validation quadratic for large NFAs
+    stateSet = set(states)
+    sigmaSet = set(sigma)
     if len(sigma) == 0:
         raise UndefinedAlphabetError("Alphabet is not defined")
         return False
@@ -199,54 +229,110 @@ def isNfaValid(NFA):
         raise UndefinedStartStateError("Start state is not defined")
         return False 
     
-    elif start not in states:
+    elif start not in stateSet:
         raise InvalidStateError(f"Start state {start} is not defined")
         return False
     
-    if accept == []:
+    if len(accept) == 0:
         raise UndefinedAcceptStatesError("Accept state is not defined")
         return False 
     
     else:
         for acceptState in accept:
-            if acceptState not in states:
+            if acceptState not in stateSet:
                 raise InvalidStateError(f"Accept state {acceptState} is not defined")
                 return False
             
             
     for sourceState in rules: # rules dict key is the source state of the rule
     
-        if sourceState not in states:
+        if sourceState not in stateSet:
             raise InvalidStateError(f"Source state {sourceState} is not defined in the states list for the NFA")
             return False
         
         for symbol in rules[sourceState]:
-            if symbol not in sigma and symbol not in ["epsilon", "ε"]: # epsilon doesn't need to be defined in the alphabet
+            if symbol not in sigmaSet and symbol not in ["epsilon", "ε"]: # epsilon doesn't need to be defined in the alphabet
                 raise InvalidSymbolError(f"Symbol {symbol} is not defined in the alphabet for the NFA")
                 return False
-            elif symbol in ["epsilon", "ε"] and symbol in sigma:
+            elif symbol in ["epsilon", "ε"] and symbol in sigmaSet:
                 raise EpsilonTransitionError("Epsilon doesn't need to be defined in the alphabet for the NFA (it includes it by default). You can use 'epsilon' or 'ε' in your rules without defining epsilon or ε.")
             
             # for destinationState in rules[sourceState][symbol]: not for, as there is only one destinationState, this for would split the destinationState
             # string character by character
-            for destinationState in list(rules[sourceState][symbol]): # all possible destination states from that source state, symbol tuple
-                if destinationState not in states:
+            for destinationState in rules[sourceState][symbol]: # all possible destination states from that source state, symbol tuple
+                if destinationState not in stateSet:
                     raise InvalidStateError(f"Destination state {destinationState} {rules} is not defined in the states list for the NFA")
                     # print(sourceState, symbol, destinationState)
                     return False
                     # traverses all rules in the dictionary, looking for source states, destination states and symbols
     return True
 
+class ValidatedNFA(tuple):
+    # a NFA 5-tuple that is validated once, when it is created, and then trusted - isNfaValid returns True for it
+    # without checking it again
+    # it is still a tuple, so it unpacks like any NFA (states, sigma, rules, start, accept = NFA) and every function
+    # taking a NFA accepts it, but states, sigma and accept are tuples, the rules and the rules of every state are
+    # read-only mappings (MappingProxyType) and the destination sets are frozensets, so it can't be changed after
+    # validation - which would leave the compiled form and the lazy DFA cache kept with it out of date
+    # set-based indexes of the alphabet and the accept states (sigmaSet, acceptSet - used by the verbose runNfa) are
+    # built once, and the compiled form and the lazy DFA cache are kept with it after the first run, so they are
+    # reused by every later run
+    # isTrusted = True skips the validation - only for NFAs that were already validated before being stored
+    # (e.g. loaded from the binary cache written by cacheNFA.py), whose destination sets are already frozensets
+    def __new__(cls, NFA, isTrusted = False):
+        states, sigma, rules, start, accept = NFA
+        frozenRules = {}
+        for sourceState in rules:
+            if isTrusted:
+                frozenRules[sourceState] = MappingProxyType(rules[sourceState])
+            else:
+                frozenRules[sourceState] = MappingProxyType({symbol : frozenset(rules[sourceState][symbol])
+                                                             for symbol in rules[sourceState]})
+        frozenNFA = (tuple(states), tuple(sigma), MappingProxyType(frozenRules), start, tuple(accept))
+        if not isTrusted:
+            isNfaValid(frozenNFA) # raises the matching NFAError if it isn't valid
+
+        self = super().__new__(cls, frozenNFA)
+        self.sigmaSet = frozenset(sigma)
+        self.acceptSet = frozenset(accept)
+        self.compiledNFA = None # built by getCompiledNfa
+        self.lazyDFA = None     # built by getLazyDFA
+        self.instrumentationMasks = None # built by getInstrumentationMasks
+        return self
+
+    def __reduce__(self):
+        # only the 5-tuple is pickled (e.g. when sent to worker processes), not the compiled form and caches -
+        # with plain dicts for the rules, since read-only mappings can't be pickled
+        states, sigma, rules, start, accept = self
+        plainRules = {sourceState : dict(stateRules) for sourceState, stateRules in rules.items()}
+        return ValidatedNFA, ((states, sigma, plainRules, start, accept), True)
+
+def getCompiledNfa(NFA):
+    # compiled form of a NFA - kept with a ValidatedNFA, so it is compiled only once
+    if isinstance(NFA, ValidatedNFA):
+        if NFA.compiledNFA is None:
+            NFA.compiledNFA = compileNfa(NFA)
+        return NFA.compiledNFA
+    return compileNfa(NFA)
+
+def getLazyDFA(NFA):
+    # lazy DFA cache of a NFA - kept with a ValidatedNFA, so the DFA states found by a run are reused by later runs
+    if isinstance(NFA, ValidatedNFA):
+        if NFA.lazyDFA is None:
+            NFA.lazyDFA = LazyDFACache(getCompiledNfa(NFA))
+        return NFA.lazyDFA
+    return LazyDFACache(compileNfa(NFA))
+
 def printNfaDataStructures(NFA):
     states, sigma, rules, start, accept = NFA # getting values from 5-tuple
 
-    print(f"States : {states}")
-    print(f"Alphabet : {sigma}")
+    print(f"States : {list(states)}") # list() - a ValidatedNFA stores them as tuples
+    print(f"Alphabet : {list(sigma)}")
     print(f"Rules : {rules}")
     print(f"Start state : {start}")
 
     if len(accept) != 1:
-        print(f"Accept states : {accept}") 
+        print(f"Accept states : {list(accept)}") 
     else:
         print(f"Accept state: {accept[0]}") # to show singular form if needed and not a list with only one element
 
@@ -278,38 +364,149 @@ def splitIncludingNoSeparator(string, separator):
 def getEpsilonStatesSetMaxDepth(epsilonDepth1StatesSet, rules):
     epsilonStates = set() # set of states reached with epsilon transitions - without consuming any input symbol
     epsilonStates.update(epsilonDepth1StatesSet) # initialise it with the epsilon states with depth = 1 from current states
-    addedEpsilonState = True
-    while addedEpsilonState:
-        addedEpsilonState = False # at first while loop when no new epsilon transition state is added, it means we have reached all possible states
-                                  # with any depth of epsilon transition at this iteration, so we can exit this loop
-        newEpsilonStates = set()  # epsilon states reached in the last iteration
-        for state in epsilonStates:
-            if state in rules and 'epsilon' in rules[state]:
-                newEpsilonStates.update(rules[state]['epsilon']) # adding epsilon transitions first - by using sets we allow no duplicates
-
-        newStates = newEpsilonStates - epsilonStates
-        if newStates: # is not an empty set - we have added a new state from the previous iteration, we need 
-                      # to continue searching for posible new states reached from epsilon transitions
-            epsilonStates.update(newStates) # update the main set
-            addedEpsilonState = True
-        epsilonStates.update(newEpsilonStates)
+    statesToVisit = list(epsilonStates) # worklist - every state is expanded exactly once, instead of rescanning
+                                        # the whole growing set until nothing new is added
+    while statesToVisit:
+        state = statesToVisit.pop()
+        if state in rules and 'epsilon' in rules[state]:
+            for epsilonState in rules[state]['epsilon']:
+                if epsilonState not in epsilonStates: # by using sets we allow no duplicates
+                    epsilonStates.add(epsilonState)
+                    statesToVisit.append(epsilonState)
+    return epsilonStates
+
+def getEpsilonSuccessors(state, rules):
+    if state in rules and 'epsilon' in rules[state]:
+        return rules[state]['epsilon']
+    return ()
+
+def getEpsilonComponents(states, rules):
+    # splits the graph formed by the epsilon transitions into strongly connected components, with an iterative version
+    # of Tarjan's algorithm - all the states of a component share the same epsilon closure
+    # components are returned in reverse topological order: every component reached with an epsilon transition from
+    # a component comes before it in the list
+    components = []
+    index = {}      # order in which states are discovered
+    lowLink = {}    # smallest index reachable from the state while it is still on the stack
+    stack = []
+    onStack = set()
+    counter = 0
+
+    for rootState in states:
+        if rootState in index:
+            continue
+        index[rootState] = lowLink[rootState] = counter
+        counter += 1
+        stack.append(rootState)
+        onStack.add(rootState)
+        work = [(rootState, iter(getEpsilonSuccessors(rootState, rules)))] # explicit stack instead of recursion - long
+                                                                           # epsilon chains would exceed the recursion limit
+        while work:
+            state, successors = work[-1]
+            descended = False
+            for nextState in successors:
+                if nextState not in index:
+                    index[nextState] = lowLink[nextState] = counter
+                    counter += 1
+                    stack.append(nextState)
+                    onStack.add(nextState)
+                    work.append((nextState, iter(getEpsilonSuccessors(nextState, rules))))
+                    descended = True
+                    break
+                elif nextState in onStack:
+                    lowLink[state] = min(lowLink[state], index[nextState])
+            if descended:
+                continue
+
+            work.pop()
+            if work: # propagating the low link to the parent
+                parentState = work[-1][0]
+                lowLink[parentState] = min(lowLink[parentState], lowLink[state])
+
+            if lowLink[state] == index[state]: # state is the root of a component
+                component = []
+                while True:
+                    componentState = stack.pop()
+                    onStack.discard(componentState)
+                    component.append(componentState)
+                    if componentState == state:
+                        break
+                components.append(component)
+    return components
+
+def getEpsilonClosureTable(states, rules):
+    # epsilon closure of every single state, computed once per NFA and reused for every symbol
+    # the closure of a component is its own states plus the already computed closures of the components it points to
+    # returns a dict state -> frozenset, all the states in a component point to the same frozenset
+    closureTable = {}
+    for component in getEpsilonComponents(states, rules):
+        closure = set(component)
+        for componentState in component:
+            for nextState in getEpsilonSuccessors(componentState, rules):
+                if nextState in closureTable: # already finished - a different component
+                    closure.update(closureTable[nextState])
+        closure = frozenset(closure)
+        for componentState in component:
+            closureTable[componentState] = closure
+    return closureTable
+
+def getEpsilonClosureMasks(states, rules, stateIndex):
+    # the same closures as getEpsilonClosureTable, but as bitmasks indexed by state id - unions are integer ors
+    closureMasks = [0] * len(states)
+    for component in getEpsilonComponents(states, rules):
+        closureMask = 0
+        for componentState in component:
+            closureMask |= 1 << stateIndex[componentState]
+        for componentState in component:
+            for nextState in getEpsilonSuccessors(componentState, rules):
+                closureMask |= closureMasks[stateIndex[nextState]] # 0 for states of the same component - not finished yet
+        for componentState in component:
+            closureMasks[stateIndex[componentState]] = closureMask
+    return closureMasks
+
+def getEpsilonClosure(statesSet, closureTable):
+    # all the states reachable from statesSet with epsilon transitions (statesSet included), using a precomputed table
+    epsilonStates = set()
+    for state in statesSet:
+        epsilonStates.update(closureTable[state])
     return epsilonStates
 # currentStates.update(newEpsilonStates) # when reaching a possible epsilon transition, the NFA branch can either take it or not
                                                     # in this set we will have all the branches - with epsilon transitions and without
-def runNfa(NFA, inputString, stringSeparator, printNFASteps = True):
+def runNfa(NFA, inputString, stringSeparator, printNFASteps = True, stats = None, trace = None):
+    # stats - optional RunStats object, filled in with the size of every step and the time spent in every phase
+    # trace - optional StepTrace, the steps are recorded in it instead of being printed (printNFASteps is not used)
 
     states, sigma, rules, start, accept = NFA  # unpack the NFA
 
+    if stats is not None:
+        phaseStart = time.perf_counter()
     # NFA validity is looked upon when processing the file
     # if the functions are arranged in different files/modules, code like this is preferrable
     if not isNfaValid(NFA):
         raise NFAError("NFA not valid")
-    
+
+    if printNFASteps == False or trace is not None:
+        if stats is not None:
+            stats.addPhaseTime("validation", phaseStart)
+            return runInstrumented(NFA, inputString, stringSeparator, stats, trace)
+        if trace is not None:
+            return runTraced(NFA, inputString, stringSeparator, trace)
+        # no intermediate steps need to be shown, so the faster integer/bitmask engine can be used,
+        # with the DFA states reached memoized along the way
+        return getLazyDFA(NFA).run(inputString, stringSeparator)
+
+    if stats is not None:
+        phaseStart = stats.addPhaseTime("validation", phaseStart)
+    if isinstance(NFA, ValidatedNFA): # its set-based indexes, so every symbol and end state is found in O(1)
+        sigma, accept = NFA.sigmaSet, NFA.acceptSet
     inputString = inputString.strip() # removes whitespace, \n, from left and right
     if not isStringValid(inputString, stringSeparator, sigma):
         raise InputStringError("Input string contains symbols not in the given alphabet of the NFA")
     
     
+    closureTable = getEpsilonClosureTable(states, rules) # epsilon closures are computed once, not for every symbol
+    if stats is not None:
+        phaseStart = stats.addPhaseTime("tokenization", phaseStart)
     currentStates = {start} # first state is the start state of the NFA
     if printNFASteps == True: 
         # printNFASteps - boolean parameter - if it is true all the states and symbols the NFA encounters
@@ -321,14 +518,8 @@ def runNfa(NFA, inputString, stringSeparator, printNFASteps = True):
                 print(currentSymbol) # printing every symbol in the string
 
             nextStates = set()
-            epsilonDepth1States = set()
-            for state in currentStates:
-                if state in rules and 'epsilon' in rules[state]:
-                    epsilonDepth1States.update(rules[state]['epsilon']) # adding epsilon transitions first - by using sets we allow no duplicates
-            
-            epsilonStates = getEpsilonStatesSetMaxDepth(epsilonDepth1States, rules)
-            currentStates.update(epsilonStates) # when reaching a possible epsilon transition, the NFA branch can either take it or not
-                                                # in this set we will have all the branches - with epsilon transitions and without
+            currentStates = getEpsilonClosure(currentStates, closureTable) # when reaching a possible epsilon transition, the NFA branch can either take it or not
+                                                                           # in this set we will have all the branches - with epsilon transitions and without
 
             for state in currentStates: # now we can iterate across all possible current states, including the epsilon paths
                 destinationStates = getNextStates(state, currentSymbol, rules) # all destination states for one of the current possible states
@@ -338,16 +529,903 @@ def runNfa(NFA, inputString, stringSeparator, printNFASteps = True):
             currentStates = nextStates
             if printNFASteps == True:
                 print(currentStates)  # printing the new state of the NFA after every symbol
+            if stats is not None: # counted with the closure, like the other engines do
+                stateCount = len(getEpsilonClosure(currentStates, closureTable))
+                stats.addStep(currentSymbol, stateCount, stateCount - len(currentStates))
 
-    epsilonStates = getEpsilonStatesSetMaxDepth(currentStates, rules) # seperate check needed for states after last symbol from the input string is set
-    currentStates.update(epsilonStates)
+    if stats is not None:
+        phaseStart = stats.addPhaseTime("stepping", phaseStart)
+    currentStates = getEpsilonClosure(currentStates, closureTable) # seperate check needed for states after last symbol from the input string is set
     if printNFASteps == True:
         print(currentStates, "<- all final states after final epsilon transition search")
+    accepted = False # if all final states are rejected
     for endState in currentStates: # after the for loop exits the currentStates variable stores the last states 
         if endState in accept: # of the NFA, if one state in it is valid return true
-            return True
-    
-    return False # if all final states are rejected
+            accepted = True
+            break
+    if stats is not None:
+        stats.accepted = accepted
+        stats.addPhaseTime("acceptance", phaseStart)
+    return accepted
+
+# compiled NFA - the same automaton, but with states and symbols interned to integers and every state set stored
+# as a python int used as a bitmask (bit i set <=> states[i] is in the set)
+# it is a 5-tuple as well, consisting of:
+# states            - list of state names, the index of a state is its id (and its bit in the masks)
+# symbolIndex       - dict symbol -> symbol id
+# transitionMasks   - transitionMasks[symbolId][stateId] = mask of all states reached from that single state
+#                     after consuming the symbol, epsilon closure included
+# startMask         - epsilon closure of the start state
+# acceptMask        - mask of all accept states
+
+def compileNfa(NFA):
+    # expects a valid NFA (as returned by parseFile) - validation is not repeated here
+    states, sigma, rules, start, accept = NFA
+
+    stateIndex = {state : stateId for stateId, state in enumerate(states)}
+    symbolIndex = {symbol : symbolId for symbolId, symbol in enumerate(sigma)}
+
+    # closure mask of every single state, computed once for the whole automaton
+    closureMasks = getEpsilonClosureMasks(states, rules, stateIndex)
+
+    transitionMasks = []
+    for symbol in sigma:
+        symbolMasks = []
+        for state in states:
+            nextMask = 0
+            for destinationState in getNextStates(state, symbol, rules): # keeps the "stay in the same state" convention
+                nextMask |= closureMasks[stateIndex[destinationState]]
+            symbolMasks.append(nextMask)
+        transitionMasks.append(symbolMasks)
+
+    startMask = closureMasks[stateIndex[start]]
+    acceptMask = 0
+    for acceptState in accept:
+        acceptMask |= 1 << stateIndex[acceptState]
+
+    return states, symbolIndex, transitionMasks, startMask, acceptMask
+
+def getStatesFromMask(statesMask, states):
+    # converts a bitmask back to the set of state names it represents
+    statesSet = set()
+    while statesMask:
+        lowestBit = statesMask & -statesMask # isolates the lowest set bit
+        statesSet.add(states[lowestBit.bit_length() - 1])
+        statesMask ^= lowestBit
+    return statesSet
+
+def stepMask(currentMask, symbolMasks):
+    # the union of the destination masks of every state present in currentMask
+    nextMask = 0
+    while currentMask:
+        lowestBit = currentMask & -currentMask
+        nextMask |= symbolMasks[lowestBit.bit_length() - 1]
+        currentMask ^= lowestBit
+    return nextMask
+
+def runCompiled(compiledNFA, inputString, stringSeparator):
+    # same accept/reject results as runNfa, but every step is a handful of integer operations
+    # instead of building and hashing python sets of state names
+    states, symbolIndex, transitionMasks, startMask, acceptMask = compiledNFA
+
+    inputString = inputString.strip()
+    currentMask = startMask # the masks are always epsilon-closed, so no separate epsilon search is needed
+    for currentSymbol in splitIncludingNoSeparator(inputString, stringSeparator):
+        if currentSymbol not in symbolIndex: # the string is validated while it is being consumed - not in a separate pass
+            raise InputStringError("Input string contains symbols not in the given alphabet of the NFA")
+        symbolMasks = transitionMasks[symbolIndex[currentSymbol]]
+
+        nextMask = 0
+        while currentMask: # inlined stepMask - this is the hot loop
+            lowestBit = currentMask & -currentMask
+            nextMask |= symbolMasks[lowestBit.bit_length() - 1]
+            currentMask ^= lowestBit
+        currentMask = nextMask
+
+    return currentMask & acceptMask != 0
+
+class RunStats:
+    # instrumentation of a run - runNfa(..., stats = RunStats()) fills it in, runs without a stats object don't
+    # do any of this work
+    # stepSizes[i]     - number of active states after symbol i (epsilon closure included)
+    # closureSizes[i]  - how many of them were added by the epsilon closure (reached only through epsilon transitions)
+    # sizeHistogram    - number of active states -> number of steps with that many
+    # widestSteps      - (active states, step index, symbol) of the widestStepCount widest steps, widest first
+    #                    (none if widestStepCount is 0)
+    # phaseTimes       - seconds spent validating, splitting the input into symbols, stepping and checking acceptance
+    # onStep           - optional callback(stepIndex, symbol, stateCount, closureCount), called after every step
+    # recordSteps = False keeps only the histogram and the widest steps (memory doesn't grow with the input)
+    # the same object can be given to several runs - the steps and times add up, reset() starts over
+    def __init__(self, onStep = None, recordSteps = True, widestStepCount = 10):
+        self.onStep = onStep
+        self.recordSteps = recordSteps
+        self.widestStepCount = widestStepCount
+        self.reset()
+
+    def reset(self):
+        self.stepSizes = []
+        self.closureSizes = []
+        self.sizeHistogram = {}
+        self.widestStepsHeap = [] # min-heap of the widest steps, so the narrowest of them is the one replaced
+        self.phaseTimes = {"validation" : 0.0, "tokenization" : 0.0, "stepping" : 0.0, "acceptance" : 0.0}
+        self.symbolCount = 0
+        self.accepted = None
+
+    def addPhaseTime(self, phase, startTime):
+        # adds the time since startTime (from time.perf_counter) to the phase, returns the current time
+        currentTime = time.perf_counter()
+        self.phaseTimes[phase] += currentTime - startTime
+        return currentTime
+
+    def addStep(self, symbol, stateCount, closureCount):
+        stepIndex = self.symbolCount
+        self.symbolCount += 1
+        if self.recordSteps:
+            self.stepSizes.append(stateCount)
+            self.closureSizes.append(closureCount)
+        self.sizeHistogram[stateCount] = self.sizeHistogram.get(stateCount, 0) + 1
+        if self.widestStepCount > 0:
+            if len(self.widestStepsHeap) < self.widestStepCount:
+                heapq.heappush(self.widestStepsHeap, (stateCount, stepIndex, symbol))
+            elif stateCount > self.widestStepsHeap[0][0]:
+                heapq.heapreplace(self.widestStepsHeap, (stateCount, stepIndex, symbol))
+        if self.onStep is not None:
+            self.onStep(stepIndex, symbol, stateCount, closureCount)
+
+    @property
+    def widestSteps(self):
+        return sorted(self.widestStepsHeap, reverse = True)
+
+    def printReport(self):
+        print(f"symbols : {self.symbolCount}, accepted : {self.accepted}")
+        for phase, seconds in self.phaseTimes.items():
+            print(f"{phase} : {seconds:.6f} s")
+        if self.symbolCount:
+            totalStates = sum(size * count for size, count in self.sizeHistogram.items())
+            print(f"active states per step : average {totalStates / self.symbolCount:.2f}, max {max(self.sizeHistogram)}")
+        for stateCount, stepIndex, symbol in self.widestSteps:
+            print(f"step {stepIndex} ({symbol}) : {stateCount} active states")
+
+def getCountOfMask(statesMask):
+    # number of states in a mask
+    return bin(statesMask).count("1")
+
+def getInstrumentationMasks(NFA):
+    # masks used by runInstrumented: the epsilon closure of every single state, and stepMasks[symbolId] = destinations
+    # of every single state before the epsilon closure - kept with a ValidatedNFA, like the compiled form, so runs
+    # reusing the NFA don't go through its rules again
+    if isinstance(NFA, ValidatedNFA) and NFA.instrumentationMasks is not None:
+        return NFA.instrumentationMasks
+    states, sigma, rules, start, accept = NFA
+    stateIndex = {state : stateId for stateId, state in enumerate(states)}
+    closureMasks = getEpsilonClosureMasks(states, rules, stateIndex)
+    stepMasks = [[sum(1 << stateIndex[destinationState] for destinationState in getNextStates(state, symbol, rules))
+                  for state in states]
+                 for symbol in sigma]
+    if isinstance(NFA, ValidatedNFA):
+        NFA.instrumentationMasks = closureMasks, stepMasks
+    return closureMasks, stepMasks
+
+def runInstrumented(NFA, inputString, stringSeparator, stats, trace = None):
+    # runNfa(NFA, inputString, stringSeparator, False) filling in stats, and trace if given (the NFA is already validated)
+    # runs on the compiled masks, with the steps before the epsilon closure kept apart to count what the closure adds
+    phaseStart = time.perf_counter()
+    compiledNFA = getCompiledNfa(NFA)
+    states, symbolIndex, transitionMasks, startMask, acceptMask = compiledNFA
+    closureMasks, stepMasks = getInstrumentationMasks(NFA)
+    symbols = list(splitIncludingNoSeparator(inputString.strip(), stringSeparator))
+    phaseStart = stats.addPhaseTime("tokenization", phaseStart)
+
+    steps = {}     # (mask, symbol id) -> (next mask, state count, closure count) - like the lazy DFA, repeated sets are free
+    currentMask = startMask
+    if trace is not None:
+        trace.startRun(states)
+        trace.addStep(0, "", currentMask)
+    stepIndex = 0
+    lastSymbol = ""
+    for currentSymbol in symbols:
+        if currentSymbol not in symbolIndex:
+            stats.addPhaseTime("stepping", phaseStart)
+            if trace is not None:
+                trace.finishRun(None, stepIndex, lastSymbol, currentMask)
+            raise InputStringError("Input string contains symbols not in the given alphabet of the NFA")
+        symbolId = symbolIndex[currentSymbol]
+        step = steps.get((currentMask, symbolId))
+        if step is None:
+            steppedMask = stepMask(currentMask, stepMasks[symbolId])
+            nextMask = stepMask(steppedMask, closureMasks) # the same mask as stepMask(currentMask, transitionMasks[symbolId])
+            stateCount = getCountOfMask(nextMask)
+            step = (nextMask, stateCount, stateCount - getCountOfMask(steppedMask))
+            if len(steps) >= 100000:
+                steps.clear()
+            steps[(currentMask, symbolId)] = step
+        currentMask = step[0]
+        stats.addStep(currentSymbol, step[1], step[2])
+        stepIndex += 1
+        lastSymbol = currentSymbol
+        if trace is not None and stepIndex % trace.every == 0:
+            trace.addStep(stepIndex, currentSymbol, currentMask)
+    phaseStart = stats.addPhaseTime("stepping", phaseStart)
+
+    stats.accepted = currentMask & acceptMask != 0 # the masks are already closed - no separate final closure
+    if trace is not None:
+        trace.finishRun(stats.accepted, stepIndex, lastSymbol, currentMask)
+    stats.addPhaseTime("acceptance", phaseStart)
+    return stats.accepted
+
+class StepTrace:
+    # compact trace of a run - runNfa(..., trace = StepTrace(...)) records the active states after the steps
+    # instead of printing them, so long inputs can be traced
+    # a record is one line - step index, symbol and the ids of the active states (epsilon closure included), tab
+    # separated, e.g. "12\ta\t0 3 7" - step 0 is the start, with no symbol
+    # the ids are the positions of the states in the NFA, listed once on the first line ("#states\tq0\tq1...");
+    # a run ends with a "#accepted", "#rejected" or "#invalid" line
+    # outputFile    - file name (written with a large buffer) or open text file; None keeps the records in memory only
+    # every = N     - only every Nth step is recorded (the last step of a run always is)
+    # last = K      - only the last K recorded steps of a run are kept, in a ring buffer, and written when it ends
+    # onlyRejected  - with last, the steps of accepted runs are not written at all
+    def __init__(self, outputFile = None, every = 1, last = None, onlyRejected = False, bufferSize = 1 << 20):
+        if every < 1:
+            raise ValueError(f"every must be at least 1 (every Nth step is recorded), not {every}")
+        if last is not None and last < 1:
+            raise ValueError(f"last must be at least 1 (the last K steps are kept), not {last}")
+        if isinstance(outputFile, str):
+            self.file = open(outputFile, "w", encoding = "utf-8", buffering = bufferSize)
+            self.ownsFile = True
+        else:
+            self.file = outputFile
+            self.ownsFile = False
+        self.every = every
+        self.last = last
+        self.onlyRejected = onlyRejected
+        self.records = deque(maxlen = last) # (step index, symbol, states mask) - masks are turned into ids when written
+        self.states = None
+        self.runCount = 0
+        self.stateIdStrings = {} # states mask -> its ids as written - the same sets come back often
+
+    def startRun(self, states):
+        if self.states is None and self.file is not None:
+            self.file.write("#states\t" + "\t".join(states) + "\n")
+        self.states = states
+        self.runCount += 1
+        if self.runCount > 1 and self.file is not None:
+            self.file.write(f"#run\t{self.runCount}\n")
+        self.records.clear() # only the records of the current run are kept
+
+    def addStep(self, stepIndex, symbol, statesMask):
+        if self.file is not None and self.last is None:
+            self.writeRecord(stepIndex, symbol, statesMask) # written straight away - only the file's buffer is in memory
+        else:
+            self.records.append((stepIndex, symbol, statesMask))
+
+    def finishRun(self, result, stepIndex, symbol, statesMask):
+        # result - True, False or None (symbol not in the alphabet); the last step is recorded if sampling skipped it
+        if stepIndex % self.every != 0:
+            self.addStep(stepIndex, symbol, statesMask)
+        if self.file is None:
+            return
+        if self.last is not None and not (self.onlyRejected and result == True):
+            for record in self.records:
+                self.writeRecord(*record)
+        self.file.write("#accepted\n" if result == True else "#rejected\n" if result == False else "#invalid\n")
+
+    def writeRecord(self, stepIndex, symbol, statesMask):
+        stateIdString = self.stateIdStrings.get(statesMask)
+        if stateIdString is None:
+            stateIds = []
+            remainingMask = statesMask
+            while remainingMask:
+                lowestBit = remainingMask & -remainingMask
+                stateIds.append(str(lowestBit.bit_length() - 1))
+                remainingMask ^= lowestBit
+            stateIdString = " ".join(stateIds)
+            if len(self.stateIdStrings) >= 10000:
+                self.stateIdStrings.clear()
+            self.stateIdStrings[statesMask] = stateIdString
+        self.file.write(f"{stepIndex}\t{symbol}\t{stateIdString}\n")
+
+    def getStates(self, statesMask):
+        # names of the states of a recorded mask
+        return getStatesFromMask(statesMask, self.states)
+
+    def close(self):
+        if self.ownsFile:
+            self.file.close()
+        elif self.file is not None:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exceptionType, exceptionValue, traceback):
+        self.close()
+
+def runTraced(NFA, inputString, stringSeparator, trace):
+    # runNfa(NFA, inputString, stringSeparator, False) recording the steps in trace (the NFA is already validated)
+    # the steps go through the lazy DFA cache, so a traced run is only slower by the records written
+    lazyDFA = getLazyDFA(NFA)
+    states, symbolIndex, transitionMasks, startMask, acceptMask = lazyDFA.compiledNFA
+    every = trace.every
+    trace.startRun(states)
+    currentMask = startMask
+    trace.addStep(0, "", currentMask)
+    stepIndex = 0
+    lastSymbol = ""
+    for currentSymbol in splitIncludingNoSeparator(inputString.strip(), stringSeparator):
+        if currentSymbol not in symbolIndex:
+            trace.finishRun(None, stepIndex, lastSymbol, currentMask)
+            raise InputStringError("Input string contains symbols not in the given alphabet of the NFA")
+        currentMask = lazyDFA.getNextMask(currentMask, symbolIndex[currentSymbol])
+        stepIndex += 1
+        lastSymbol = currentSymbol
+        if stepIndex % every == 0:
+            trace.addStep(stepIndex, currentSymbol, currentMask)
+    accepted = currentMask & acceptMask != 0
+    trace.finishRun(accepted, stepIndex, lastSymbol, currentMask)
+    return accepted
+
+class LazyDFACache:
+    # on-the-fly subset construction over a compiled NFA
+    # every distinct (epsilon-closed) state set reached while running is memoized as a DFA state, a row holding
+    # its successor for every symbol, filled in the first time that symbol is read from it - after warm-up a step is
+    # one dict lookup and one list index instead of a union over all the active states
+    # the number of memoized DFA states is bounded, the least recently used ones are evicted
+    def __init__(self, compiledNFA, maxStates = 10000):
+        self.compiledNFA = compiledNFA
+        self.maxStates = maxStates
+        self.rows = OrderedDict() # rows[statesMask] = [successor mask or None for every symbol id]
+        self.hits = 0
+        self.misses = 0      # transitions that had to be computed by stepping the NFA
+        self.evictions = 0
+        self.fallbacks = 0   # runs that gave up on the cache because it was thrashing
+        self.liveMask = None        # set by getVerdictMasks, only for runs that stop early
+        self.mustAcceptMask = None
+
+    def getRow(self, statesMask):
+        row = self.rows.get(statesMask)
+        if row is None:
+            if len(self.rows) >= self.maxStates:
+                self.rows.popitem(last = False) # evicting the least recently used DFA state
+                self.evictions += 1
+            row = [None] * len(self.compiledNFA[2])
+            self.rows[statesMask] = row
+        else:
+            self.rows.move_to_end(statesMask)
+        return row
+
+    def getNextMask(self, statesMask, symbolId):
+        # one step of the DFA - computed with the NFA the first time, then read from the cache
+        row = self.getRow(statesMask)
+        nextMask = row[symbolId]
+        if nextMask is None:
+            nextMask = row[symbolId] = stepMask(statesMask, self.compiledNFA[2][symbolId])
+            self.misses += 1
+        else:
+            self.hits += 1
+        return nextMask
+
+    def run(self, inputString, stringSeparator):
+        inputString = inputString.strip()
+        return self.runSymbols(splitIncludingNoSeparator(inputString, stringSeparator))
+
+    def getVerdictMasks(self):
+        # states that can still lead to acceptance, and states from which every input is accepted - computed once
+        if self.liveMask is None:
+            self.liveMask = getLiveMask(self.compiledNFA)
+            self.mustAcceptMask = getMustAcceptMask(self.compiledNFA)
+        return self.liveMask, self.mustAcceptMask
+
+    def runSymbolsEarlyExit(self, symbols):
+        # like runSymbols, but stops as soon as the result can't change anymore: when no active state can reach an
+        # accept state (rejected whatever follows), or when an active state accepts whatever follows
+        # returns (accepted, number of symbols consumed) - the symbols after that point aren't read, so they aren't
+        # checked against the alphabet either
+        states, symbolIndex, transitionMasks, startMask, acceptMask = self.compiledNFA
+        liveMask, mustAcceptMask = self.getVerdictMasks()
+        currentMask = startMask
+        consumedCount = 0
+        for currentSymbol in symbols:
+            if currentMask & mustAcceptMask:
+                return True, consumedCount
+            if not currentMask & liveMask:
+                return False, consumedCount
+            if currentSymbol not in symbolIndex:
+                raise InputStringError("Input string contains symbols not in the given alphabet of the NFA")
+            currentMask = self.getNextMask(currentMask, symbolIndex[currentSymbol])
+            consumedCount += 1
+        return currentMask & acceptMask != 0, consumedCount
+
+    def runSymbols(self, symbols):
+        # symbols can be any iterable (e.g. the generator returned by iterateSymbols) - each symbol is validated
+        # when it is consumed
+        return self.getFinalMask(symbols) & self.compiledNFA[4] != 0
+
+    def getFinalMask(self, symbols):
+        # the (epsilon-closed) set of states reached after all the symbols, as a mask
+        states, symbolIndex, transitionMasks, startMask, acceptMask = self.compiledNFA
+        rows = self.rows
+        getRow = self.getRow
+
+        symbols = iter(symbols)
+        currentMask = startMask
+        hits = misses = 0
+        # thrashing check - every maxStates symbols, if the cache had to evict and more than half of the steps
+        # were misses, the remaining input is processed with plain NFA stepping
+        windowSymbols = windowMisses = 0
+        windowEvictions = self.evictions
+        thrashing = False
+
+        for currentSymbol in symbols:
+            if currentSymbol not in symbolIndex:
+                raise InputStringError("Input string contains symbols not in the given alphabet of the NFA")
+            symbolId = symbolIndex[currentSymbol]
+
+            row = rows.get(currentMask)
+            if row is None:
+                row = getRow(currentMask)
+            else:
+                rows.move_to_end(currentMask)
+            nextMask = row[symbolId]
+            if nextMask is None:
+                nextMask = row[symbolId] = stepMask(currentMask, transitionMasks[symbolId])
+                misses += 1
+                windowMisses += 1
+            else:
+                hits += 1
+            currentMask = nextMask
+
+            windowSymbols += 1
+            if windowSymbols == self.maxStates:
+                if self.evictions > windowEvictions and 2 * windowMisses > windowSymbols:
+                    thrashing = True
+                    break
+                windowSymbols = windowMisses = 0
+                windowEvictions = self.evictions
+
+        if thrashing: # the reachable subsets don't fit in the cache - caching them only costs time
+            self.fallbacks += 1
+            for currentSymbol in symbols:
+                if currentSymbol not in symbolIndex:
+                    raise InputStringError("Input string contains symbols not in the given alphabet of the NFA")
+                currentMask = stepMask(currentMask, transitionMasks[symbolIndex[currentSymbol]])
+
+        self.hits += hits
+        self.misses += misses
+        return currentMask
+
+class NFASession:
+    # incremental runner - the input arrives a few symbols at a time (e.g. over a socket) and the question
+    # "is the NFA accepting right now?" can be answered after every piece, without re-running the whole prefix
+    # the state of the session is a single int (the epsilon-closed mask of the active states), so snapshot and
+    # restore are O(1)
+    # sessions over the same NFA can share one LazyDFACache, so the DFA states one of them discovers are reused by the others
+    def __init__(self, NFA, stringSeparator = "", lazyDFA = None):
+        if lazyDFA is None:
+            if not isNfaValid(NFA):
+                raise NFAError("NFA not valid")
+            lazyDFA = getLazyDFA(NFA)
+        self.lazyDFA = lazyDFA
+        self.stringSeparator = stringSeparator
+        self.reset()
+
+    def reset(self):
+        self.statesMask = self.lazyDFA.compiledNFA[3] # start mask
+        self.symbolCount = 0 # symbols consumed so far
+
+    def feedSymbol(self, symbol):
+        symbolIndex = self.lazyDFA.compiledNFA[1]
+        if symbol not in symbolIndex:
+            raise InputStringError("Input string contains symbols not in the given alphabet of the NFA")
+        self.statesMask = self.lazyDFA.getNextMask(self.statesMask, symbolIndex[symbol])
+        self.symbolCount += 1
+
+    def feed(self, inputChunk):
+        # a chunk holds whole symbols, split with the session's separator (every character is a symbol with no separator)
+        # if a symbol is not in the alphabet nothing from the chunk is consumed - the session stays where it was
+        if inputChunk == "":
+            return
+        symbolIndex = self.lazyDFA.compiledNFA[1]
+        getNextMask = self.lazyDFA.getNextMask
+        statesMask = self.statesMask
+        symbolCount = self.symbolCount
+        for symbol in splitIncludingNoSeparator(inputChunk, self.stringSeparator):
+            if symbol not in symbolIndex:
+                raise InputStringError("Input string contains symbols not in the given alphabet of the NFA")
+            statesMask = getNextMask(statesMask, symbolIndex[symbol])
+            symbolCount += 1
+        self.statesMask = statesMask
+        self.symbolCount = symbolCount
+
+    def isAccepting(self):
+        return self.statesMask & self.lazyDFA.compiledNFA[4] != 0
+
+    def currentStates(self):
+        # names of the active states, epsilon closure included
+        return getStatesFromMask(self.statesMask, self.lazyDFA.compiledNFA[0])
+
+    def snapshot(self):
+        return self.statesMask, self.symbolCount # immutable - can be kept and restored any number of times
+
+    def restore(self, snapshot):
+        self.statesMask, self.symbolCount = snapshot
+
+# streaming input - the input string is read from a file in chunks and split into symbols on the fly, so the whole
+# input never has to be in memory (neither as one string nor as a list of symbols)
+
+def readInputChunks(inputFile, chunkSize = 1 << 20):
+    # yields the contents of an open text file in pieces of about chunkSize characters
+    # regular files are memory mapped and decoded incrementally (with the file's encoding and universal newlines,
+    # the same text as read() would give), anything else (stdin, pipes, empty files) is read with read(chunkSize)
+    try:
+        fileMap = mmap.mmap(inputFile.fileno(), 0, access = mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        fileMap = None
+
+    if fileMap is None:
+        while True:
+            chunk = inputFile.read(chunkSize)
+            if not chunk:
+                return
+            yield chunk
+
+    with fileMap:
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(inputFile.encoding or "utf-8")(), translate = True)
+        for offset in range(0, len(fileMap), chunkSize):
+            chunk = decoder.decode(fileMap[offset : offset + chunkSize]) # only this slice is copied out of the map
+            if chunk:
+                yield chunk
+        chunk = decoder.decode(b"", final = True)
+        if chunk:
+            yield chunk
+
+def getStrippedChunks(chunks):
+    # the streaming equivalent of strip() on the whole input - whitespace at the start is dropped, and whitespace
+    # is held back until some other character follows it, so the whitespace at the end is never yielded
+    pendingWhitespace = ""
+    started = False
+    for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            started = True
+        strippedChunk = chunk.rstrip()
+        if not strippedChunk: # the whole chunk is whitespace - it may or may not be at the end of the input
+            pendingWhitespace += chunk
+            continue
+        if pendingWhitespace:
+            yield pendingWhitespace
+            pendingWhitespace = ""
+        yield strippedChunk
+        pendingWhitespace = chunk[len(strippedChunk):]
+
+def iterateSymbols(chunks, stringSeparator):
+    # yields the symbols of the text made of all the chunks, exactly like splitIncludingNoSeparator on the whole text
+    # a separator split between two chunks (multi-character separators) is found, because the unfinished symbol
+    # at the end of a chunk is carried over to the next one
+    if stringSeparator == "":
+        for chunk in chunks:
+            yield from chunk # every character is a symbol
+        return
+
+    unfinishedSymbol = ""
+    for chunk in chunks:
+        symbols = (unfinishedSymbol + chunk).split(stringSeparator)
+        unfinishedSymbol = symbols.pop() # the last piece may continue in the next chunk
+        yield from symbols
+    yield unfinishedSymbol
+
+def runNfaStream(NFA, inputFile, stringSeparator, chunkSize = 1 << 20):
+    # same result as runNfa(NFA, inputFile.read(), stringSeparator, False), reading the file in chunks
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+    symbols = iterateSymbols(getStrippedChunks(readInputChunks(inputFile, chunkSize)), stringSeparator)
+    return getLazyDFA(NFA).runSymbols(symbols)
+
+def runNfaEarlyExit(NFA, inputString, stringSeparator):
+    # runNfa(NFA, inputString, stringSeparator, False) that stops reading the input as soon as the result is known
+    # returns (accepted, number of symbols consumed)
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+    return getLazyDFA(NFA).runSymbolsEarlyExit(splitIncludingNoSeparator(inputString.strip(), stringSeparator))
+
+def runNfaStreamEarlyExit(NFA, inputFile, stringSeparator, chunkSize = 1 << 20):
+    # runNfaStream that stops reading the file as soon as the result is known - returns (accepted, symbols consumed)
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+    symbols = iterateSymbols(getStrippedChunks(readInputChunks(inputFile, chunkSize)), stringSeparator)
+    return getLazyDFA(NFA).runSymbolsEarlyExit(symbols)
+
+def runNfaBatch(NFA, inputStrings, stringSeparator, printNFASteps = False):
+    # runs the NFA on every string of an iterable (e.g. an open file - one input string per line) and yields,
+    # in order, True (accepted), False (rejected) or None (the string has symbols not in the alphabet)
+    # the NFA is validated and compiled only once, and the strings are consumed one at a time, so memory
+    # doesn't depend on how many strings there are
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+    lazyDFA = getLazyDFA(NFA) # shared by all the strings - the DFA states reached stay cached between them
+
+    for inputString in inputStrings:
+        try:
+            if printNFASteps == True:
+                yield runNfa(NFA, inputString, stringSeparator, True)
+            else:
+                yield lazyDFA.run(inputString, stringSeparator)
+        except InputStringError:
+            yield None
+
+# many NFAs run over the same input in a single pass
+# the compiled NFAs are put side by side in one compiled NFA (disjoint union - automaton i gets the state ids
+# from its offset on), so the input is split into symbols once and every symbol is one step of the combined automaton,
+# with the lazy DFA cache working on the combined state sets
+# every automaton also gets an extra "invalid" state, which all its states go to on a symbol outside its alphabet and
+# which it never leaves - the same input is valid for some automata and not for others, and the ones it isn't
+# valid for are told apart by that state at the end
+
+class MultiNFA:
+    def __init__(self, NFAs, maxStates = 10000):
+        compiledNFAs = []
+        for NFA in NFAs:
+            if not isNfaValid(NFA):
+                raise NFAError("NFA not valid")
+            compiledNFAs.append(getCompiledNfa(NFA))
+
+        symbolIndex = {} # union of the alphabets
+        for compiledNFA in compiledNFAs:
+            for symbol in compiledNFA[1]:
+                symbolIndex.setdefault(symbol, len(symbolIndex))
+
+        states = []               # (automaton index, state name) - the state name is None for the invalid states
+        transitionMasks = [[] for symbol in symbolIndex]
+        startMask = 0
+        self.acceptMasks = []     # accept states of every automaton, in the combined state ids
+        self.invalidMasks = []    # invalid state of every automaton
+        for automatonIndex, compiledNFA in enumerate(compiledNFAs):
+            nfaStates, nfaSymbolIndex, nfaTransitionMasks, nfaStartMask, nfaAcceptMask = compiledNFA
+            offset = len(states)
+            invalidMask = 1 << (offset + len(nfaStates))
+            states.extend((automatonIndex, state) for state in nfaStates)
+            states.append((automatonIndex, None))
+            for symbol, symbolId in symbolIndex.items():
+                if symbol in nfaSymbolIndex:
+                    symbolMasks = [destinationMask << offset for destinationMask in nfaTransitionMasks[nfaSymbolIndex[symbol]]]
+                else:
+                    symbolMasks = [invalidMask] * len(nfaStates)
+                symbolMasks.append(invalidMask)
+                transitionMasks[symbolId].extend(symbolMasks)
+            startMask |= nfaStartMask << offset
+            self.acceptMasks.append(nfaAcceptMask << offset)
+            self.invalidMasks.append(invalidMask)
+
+        acceptMask = 0
+        for automatonAcceptMask in self.acceptMasks:
+            acceptMask |= automatonAcceptMask
+        self.compiledNFA = (states, symbolIndex, transitionMasks, startMask, acceptMask)
+        self.lazyDFA = LazyDFACache(self.compiledNFA, maxStates)
+
+    def getResults(self, statesMask):
+        # True (accepted), False (rejected) or None (symbols not in its alphabet) for every automaton
+        results = []
+        for acceptMask, invalidMask in zip(self.acceptMasks, self.invalidMasks):
+            if statesMask & invalidMask:
+                results.append(None)
+            else:
+                results.append(statesMask & acceptMask != 0)
+        return results
+
+    def runSymbols(self, symbols):
+        try:
+            return self.getResults(self.lazyDFA.getFinalMask(symbols))
+        except InputStringError: # a symbol that is in none of the alphabets
+            return [None] * len(self.acceptMasks)
+
+    def run(self, inputString, stringSeparator):
+        return self.runSymbols(splitIncludingNoSeparator(inputString.strip(), stringSeparator))
+
+    def runStream(self, inputFile, stringSeparator, chunkSize = 1 << 20):
+        # run on the contents of an open file, read in chunks (see runNfaStream)
+        return self.runSymbols(iterateSymbols(getStrippedChunks(readInputChunks(inputFile, chunkSize)), stringSeparator))
+
+def runMultiNfa(NFAs, inputString, stringSeparator):
+    # True, False or None for every NFA of the list, in order - the same results as running runNfa on each of them,
+    # with None where runNfa would raise InputStringError
+    return MultiNFA(NFAs).run(inputString, stringSeparator)
+
+# scanning - every substring (of at least one symbol) accepted by the NFA, in one pass over the input
+# instead of running the NFA from every start position, a new run is started at every position and all the runs
+# are stepped together: every active state keeps a mask of the lengths of the runs that are in it (bit k set <=> a
+# run started k symbols ago is in that state) - after every symbol the masks are shifted left by one, and the runs
+# in an accept state are the matches ending there
+# a mask is only as wide as the longest run still alive, and runs that reach the same state are merged, so a step
+# costs about as much as a step of runCompiled, for all the start positions at once
+# positions are symbol indexes in the stripped input - a match (start, end) is made of the symbols start to end - 1
+# runs in a state from which no accept state can be reached are dropped - otherwise a dead state would keep the
+# lengths of every failed run, and its mask would grow with the input
+
+def getLiveMask(compiledNFA):
+    # mask of the states from which an accept state can still be reached (the accept states included)
+    states, symbolIndex, transitionMasks, startMask, acceptMask = compiledNFA
+    predecessorIds = [[] for state in states]
+    for symbolMasks in transitionMasks:
+        for stateId, destinationMask in enumerate(symbolMasks):
+            while destinationMask:
+                lowestBit = destinationMask & -destinationMask
+                predecessorIds[lowestBit.bit_length() - 1].append(stateId)
+                destinationMask ^= lowestBit
+
+    liveMask = acceptMask
+    statesToVisit = [stateId for stateId in range(len(states)) if acceptMask >> stateId & 1]
+    while statesToVisit:
+        for predecessorId in predecessorIds[statesToVisit.pop()]:
+            if not liveMask >> predecessorId & 1:
+                liveMask |= 1 << predecessorId
+                statesToVisit.append(predecessorId)
+    return liveMask
+
+def getMustAcceptMask(compiledNFA):
+    # mask of the states from which every input is accepted: accept states that, whatever the symbol, always keep
+    # a state of the mask active - the greatest such set, found by starting from all the accept states and dropping
+    # the ones that have a symbol leading out of the set, until none is dropped
+    # (an accept state without rules stays where it is on every symbol, so it is always in it)
+    states, symbolIndex, transitionMasks, startMask, acceptMask = compiledNFA
+    mustAcceptMask = acceptMask
+    isChanged = True
+    while isChanged:
+        isChanged = False
+        remainingMask = mustAcceptMask
+        while remainingMask:
+            lowestBit = remainingMask & -remainingMask
+            stateId = lowestBit.bit_length() - 1
+            remainingMask ^= lowestBit
+            for symbolMasks in transitionMasks:
+                if not symbolMasks[stateId] & mustAcceptMask:
+                    mustAcceptMask ^= lowestBit
+                    isChanged = True
+                    break
+    return mustAcceptMask
+
+def getMatchLengths(compiledNFA, symbols):
+    # yields (end, lengthsMask) for every position where at least one substring ending there is accepted
+    # (bit k of lengthsMask set <=> the substring of the k symbols before end is accepted)
+    states, symbolIndex, transitionMasks, startMask, acceptMask = compiledNFA
+    liveMask = getLiveMask(compiledNFA)
+    startStateIds = [stateId for stateId in range(len(states)) if (startMask & liveMask) >> stateId & 1]
+    acceptStateIds = [stateId for stateId in range(len(states)) if acceptMask >> stateId & 1]
+
+    runLengths = {} # state id -> mask of the lengths of the runs in that state
+    end = 0
+    for currentSymbol in symbols:
+        if currentSymbol not in symbolIndex:
+            raise InputStringError("Input string contains symbols not in the given alphabet of the NFA")
+        symbolMasks = transitionMasks[symbolIndex[currentSymbol]]
+        for stateId in startStateIds: # the run starting at this position (length 0)
+            runLengths[stateId] = runLengths.get(stateId, 0) | 1
+
+        nextRunLengths = {}
+        for stateId, lengthsMask in runLengths.items():
+            lengthsMask <<= 1 # one more symbol consumed by all these runs
+            destinationMask = symbolMasks[stateId] & liveMask
+            while destinationMask:
+                lowestBit = destinationMask & -destinationMask
+                destinationId = lowestBit.bit_length() - 1
+                nextRunLengths[destinationId] = nextRunLengths.get(destinationId, 0) | lengthsMask
+                destinationMask ^= lowestBit
+        runLengths = nextRunLengths
+        end += 1
+
+        lengthsMask = 0
+        for stateId in acceptStateIds:
+            lengthsMask |= runLengths.get(stateId, 0)
+        if lengthsMask:
+            yield end, lengthsMask
+
+def getMatches(matchLengths):
+    # (start, end) pairs from getMatchLengths, by end position and then by start position
+    for end, lengthsMask in matchLengths:
+        while lengthsMask:
+            length = lengthsMask.bit_length() - 1 # longest match first - the one with the smallest start
+            yield end - length, end
+            lengthsMask ^= 1 << length
+
+def scanNfa(NFA, inputString, stringSeparator):
+    # yields every (start, end) such that the symbols start to end - 1 of the input string are accepted, with
+    # start < end (empty substrings aren't matches), ordered by end and then by start - the matches are yielded as
+    # soon as their last symbol is read
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+    symbols = splitIncludingNoSeparator(inputString.strip(), stringSeparator)
+    yield from getMatches(getMatchLengths(getCompiledNfa(NFA), symbols))
+
+def scanNfaStream(NFA, inputFile, stringSeparator, chunkSize = 1 << 20):
+    # scanNfa on the contents of an open file, read in chunks (see runNfaStream)
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+    symbols = iterateSymbols(getStrippedChunks(readInputChunks(inputFile, chunkSize)), stringSeparator)
+    yield from getMatches(getMatchLengths(getCompiledNfa(NFA), symbols))
+
+def findFirstMatch(NFA, inputString, stringSeparator):
+    # the match that ends first (the longest one if several end at the same position), or None
+    # the input is only read up to the end of that match
+    return next(scanNfa(NFA, inputString, stringSeparator), None)
+
+def countMatches(NFA, inputString, stringSeparator):
+    # number of accepted substrings, counted without building the (start, end) pairs
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+    symbols = splitIncludingNoSeparator(inputString.strip(), stringSeparator)
+    return sum(bin(lengthsMask).count("1") for end, lengthsMask in getMatchLengths(getCompiledNfa(NFA), symbols))
+
+def getCommonPrefixLength(sequence1, sequence2, maxLength):
+    # length of the longest common prefix of two strings or lists, at most maxLength - binary search on slices,
+    # so the symbols are compared by the slice comparison and not one by one in python
+    if sequence1[:maxLength] == sequence2[:maxLength]:
+        return maxLength
+    low, high = 0, maxLength - 1 # the answer is in [low, high]
+    while low < high:
+        middle = (low + high + 1) // 2
+        if sequence1[:middle] == sequence2[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def runNfaPrefixShared(NFA, inputStrings, stringSeparator, blockSize = 100000):
+    # same results as runNfaBatch(NFA, inputStrings, stringSeparator) - True, False or None, in input order - for
+    # strings that share long prefixes (URLs, paths, keys)
+    # the strings are read blockSize at a time and every block is sorted, so strings with a common prefix are next
+    # to each other - walking them in that order is a depth first walk of their trie: the state set after every
+    # symbol of the current string is kept, and the next string starts from the state set after the prefix it shares
+    # with it, so a shared prefix is run only once per block
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+    lazyDFA = getLazyDFA(NFA)
+    states, symbolIndex, transitionMasks, startMask, acceptMask = lazyDFA.compiledNFA
+    rows = lazyDFA.rows
+
+    inputStrings = iter(inputStrings)
+    while True:
+        block = list(islice(inputStrings, blockSize))
+        if not block:
+            return
+        # without a separator the strings themselves are compared symbol by symbol, otherwise the lists of symbols are
+        keys = [splitIncludingNoSeparator(inputString.strip(), stringSeparator) for inputString in block]
+        results = [None] * len(keys)
+        hits = misses = 0
+        pathMasks = [startMask] # pathMasks[i] - states after the first i symbols of the previous key (None - invalid symbol)
+        previousKey = None
+        for keyIndex in sorted(range(len(keys)), key = keys.__getitem__):
+            key = keys[keyIndex]
+            sharedLength = 0
+            if previousKey is not None:
+                sharedLength = getCommonPrefixLength(key, previousKey, min(len(key), len(pathMasks) - 1))
+            del pathMasks[sharedLength + 1:]
+            currentMask = pathMasks[-1]
+            for symbolPosition in range(sharedLength, len(key)):
+                if currentMask is None: # the rest of the path is invalid as well
+                    break
+                currentSymbol = key[symbolPosition]
+                if currentSymbol in symbolIndex:
+                    symbolId = symbolIndex[currentSymbol]
+                    row = rows.get(currentMask) # inlined LazyDFACache.getNextMask
+                    if row is None:
+                        row = lazyDFA.getRow(currentMask)
+                    else:
+                        rows.move_to_end(currentMask)
+                    nextMask = row[symbolId]
+                    if nextMask is None:
+                        nextMask = row[symbolId] = stepMask(currentMask, transitionMasks[symbolId])
+                        misses += 1
+                    else:
+                        hits += 1
+                    currentMask = nextMask
+                else:
+                    currentMask = None
+                pathMasks.append(currentMask)
+            results[keyIndex] = None if currentMask is None else currentMask & acceptMask != 0
+            previousKey = key
+        lazyDFA.hits += hits
+        lazyDFA.misses += misses
+        yield from results
 
 def getSortedSetString(statesSubset):
     if not statesSubset: # empty set
@@ -380,98 +1458,513 @@ def getPowerSet(states): # by using bitwise operators method
         #         
         powerSet.append(subset)
     return powerSet
-'''
-def addIdentifierToStates(states, identifier):
-    modifiedStates = []
-    for state in states:
-        modifiedStates.append(state + identifier)
-    return modifiedStates
-
-def addIdentifierToRules(rules, identifier):
-    # this function will modify the sourceState and destinationState by adding identifiers
-    modifiedRules = {}
-    for sourceState in rules:
-        modifiedRules[sourceState + identifier] = {}  # Add identifier to the source state
-        for symbol in rules[sourceState]:
-            modifiedRules[sourceState + identifier][symbol] = set()
 
-            # Add identifier to the destination states
-            for destinationState in rules[sourceState][symbol]:
-                modifiedRules[sourceState + identifier][symbol].add(destinationState + identifier)
+# operations on NFAs and regular expression to NFA conversion (Thompson's construction)
+# the states of the NFAs built here are numbered: every operand gets an integer offset, so renaming a state is an
+# addition and no state name is ever copied or suffixed - the result has the states q0, q1, ...
+# missing rules mean "stay in the same state" in this project, while in Thompson's construction they mean that the
+# branch dies - so the NFAs built here have a dead state, and every state has a rule for every symbol (the
+# states that only have epsilon rules go to the dead state on every symbol)
 
-    return modifiedRules
+def getNumberedRules(NFA, sigma, offset):
+    # the rules of a NFA with the state number i renamed to offset + i, as a list of {symbol : [destination ids]}
+    # the "stay in the same state" rules are written out for the symbols of the NFA's own alphabet - the symbols
+    # of sigma outside it are left out, so they go to the dead state
+    states, nfaSigma, rules, start, accept = NFA
+    stateIndex = {state : offset + stateNumber for stateNumber, state in enumerate(states)}
+    numberedRules = []
+    for state in states:
+        stateRules = rules.get(state, {})
+        numberedRule = {}
+        for symbol in nfaSigma:
+            if symbol in stateRules:
+                numberedRule[symbol] = [stateIndex[destinationState] for destinationState in stateRules[symbol]]
+            else:
+                numberedRule[symbol] = [stateIndex[state]]
+        if 'epsilon' in stateRules:
+            numberedRule['epsilon'] = [stateIndex[destinationState] for destinationState in stateRules['epsilon']]
+        numberedRules.append(numberedRule)
+    return numberedRules, stateIndex[start], [stateIndex[acceptState] for acceptState in accept]
 
-    for sourceState in rules:
-        modifiedRules[sourceState + identifier] = {} # add the identifier to the source states
-        for symbol in rules[sourceState]:
-            modifiedRules[sourceState + identifier][symbol] = set()
-            
-            # add the identifier to the destination states
-            for destinationState in rules[sourceState][symbol]:
-                modifiedRules[sourceState + identifier][symbol].add(destinationState + identifier)
+def getNumberedNFA(numberedRules, startId, acceptIds, sigma, deadId):
+    # builds the NFA 5-tuple from numbered rules - the symbols a state has no rule for go to the dead state
+    states = [f"q{stateId}" for stateId in range(len(numberedRules))]
+    rules = {}
+    for stateId, numberedRule in enumerate(numberedRules):
+        stateRules = {}
+        for symbol in sigma:
+            stateRules[symbol] = {states[destinationId] for destinationId in numberedRule.get(symbol, (deadId,))}
+        if 'epsilon' in numberedRule:
+            stateRules['epsilon'] = {states[destinationId] for destinationId in numberedRule['epsilon']}
+        rules[states[stateId]] = stateRules
+    return ValidatedNFA((states, sigma, rules, states[startId], [states[acceptId] for acceptId in acceptIds]))
 
-    return modifiedRules
+def getUnionSigma(*NFAs):
+    # the symbols of every NFA, in order of first appearance
+    sigma = {}
+    for NFA in NFAs:
+        sigma.update(dict.fromkeys(NFA[1]))
+    return list(sigma)
 
 def union(NFA1, NFA2):
-    # performs the union operation to 2 NFAs that are equivalent to 2 regular expressions
-    states1, sigma1, rules1, start1, accept1 = NFA1
-    states2, sigma2, rules2, start2, accept2 = NFA2 
-    
-    for stateIndex in range(len(states1)):
-        states1[stateIndex] += "_1" # adding identifier to end of state name
-    for stateIndex in range(len(states2)):
-        states2[stateIndex] += "_2" # adding identifier to end of state name
-    for sourceState in rules:
-        for symbol in rules[sourceState]:
-            for destinationState in list(rules[sourceState][symbol]):
-
-    states1 = addIdentifierToStates(states1, "_1")
-    states2 = addIdentifierToStates(states2, "_2")
-    rules1 = addIdentifierToRules(rules1, "_1")
-    rules2 = addIdentifierToRules(rules2, "_2")
-    unionStates = states1 + states2 + ["0"]
-    unionSigma = set(sigma1).update(set(sigma2))
-    unionSigma = list(unionSigma) 
-    unionRules = rules1 
-    unionRules.update(rules2) # merging 2 hashmaps
-    newEpsilonRules = {"0": {"epsilon" : set([start1 + "_1", start2 + "_1"]) } }
-    unionRules.update(newEpsilonRules)
-    accept1 = 
-    unionAccept =
-    unionStart = "0"
-    unionNFA = (unionStates, unionSigma, unionRules, unionStart, unionAccept)
-    return unionNFA
-
-
-
-# getCurrentState - modularitate cod - enter next move
-# editor harti joc
-#     
+    # NFA accepting the strings accepted by NFA1 or by NFA2 - the operands are not modified
+    # q0 is the dead state, q1 the new start state, with epsilon rules to the start states of both NFAs
+    for NFA in (NFA1, NFA2):
+        if not isNfaValid(NFA):
+            raise NFAError("NFA not valid")
+    sigma = getUnionSigma(NFA1, NFA2)
+    rules1, start1, accept1 = getNumberedRules(NFA1, sigma, 2)
+    rules2, start2, accept2 = getNumberedRules(NFA2, sigma, 2 + len(rules1))
+    numberedRules = [{}, {'epsilon' : [start1, start2]}] + rules1 + rules2
+    return getNumberedNFA(numberedRules, 1, accept1 + accept2, sigma, 0)
+
 def concatenation(NFA1, NFA2):
-    # concatenates 2 NFAs that are equivalent to 2 regular expressions
+    # NFA accepting a string accepted by NFA1 followed by a string accepted by NFA2 - the operands are not modified
+    # the accept states of NFA1 get an epsilon rule to the start state of NFA2
+    for NFA in (NFA1, NFA2):
+        if not isNfaValid(NFA):
+            raise NFAError("NFA not valid")
+    sigma = getUnionSigma(NFA1, NFA2)
+    rules1, start1, accept1 = getNumberedRules(NFA1, sigma, 1)
+    rules2, start2, accept2 = getNumberedRules(NFA2, sigma, 1 + len(rules1))
+    for acceptId in accept1:
+        rules1[acceptId - 1].setdefault('epsilon', []).append(start2)
+    return getNumberedNFA([{}] + rules1 + rules2, start1, accept2, sigma, 0)
 
 def star(NFA):
-    # performs the star operation on a NFA - equivalent to a regular expression
+    # NFA accepting any number (zero included) of strings accepted by NFA, one after the other
+    # the new start state is also an accept state (the empty string), and the accept states of NFA get an
+    # epsilon rule back to its start state
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+    sigma = list(NFA[1])
+    numberedRules, start, accept = getNumberedRules(NFA, sigma, 2)
+    for acceptId in accept:
+        numberedRules[acceptId - 2].setdefault('epsilon', []).append(start)
+    return getNumberedNFA([{}, {'epsilon' : [start]}] + numberedRules, 1, accept + [1], sigma, 0)
 
-def convertRegextoNFA(regularExpression):
-    # regular expression will contain paranthesis, unions, concatenations and star operations
+class RegexParser:
+    # recursive descent parser building a Thompson NFA while it reads the regular expression
+    # grammar (lowest to highest precedence):
+    #   union         - concatenation ('|' concatenation)*
+    #   concatenation - repetition*            (can be empty - the empty string)
+    #   repetition    - atom ('*' | '+' | '?')*
+    #   atom          - symbol | '\' any character | 'ε' (the empty string) | '(' union ')'
+    # every part of the expression becomes a fragment, a (start id, accept id) pair with exactly one accept state,
+    # so every operator adds at most two states and four rules - the NFA is linear in the size of the expression
+    def __init__(self, regularExpression):
+        self.regularExpression = regularExpression
+        self.position = 0
+        self.numberedRules = [{}] # q0 is the dead state
+        self.symbols = {}         # symbols of the expression, in order of first appearance
 
+    def newState(self):
+        self.numberedRules.append({})
+        return len(self.numberedRules) - 1
 
+    def addRule(self, sourceId, symbol, destinationId):
+        self.numberedRules[sourceId].setdefault(symbol, []).append(destinationId)
 
+    def peek(self):
+        if self.position < len(self.regularExpression):
+            return self.regularExpression[self.position]
+        return None
+
+    def parse(self):
+        fragment = self.parseUnion()
+        if self.position < len(self.regularExpression): # only an unmatched ')' stops parseUnion early
+            raise RegexError(f"Unmatched ')' at position {self.position} in the regular expression")
+        return fragment
+
+    def parseUnion(self):
+        fragment = self.parseConcatenation()
+        while self.peek() == "|":
+            self.position += 1
+            otherFragment = self.parseConcatenation()
+            startId = self.newState()
+            acceptId = self.newState()
+            self.addRule(startId, 'epsilon', fragment[0])
+            self.addRule(startId, 'epsilon', otherFragment[0])
+            self.addRule(fragment[1], 'epsilon', acceptId)
+            self.addRule(otherFragment[1], 'epsilon', acceptId)
+            fragment = (startId, acceptId)
+        return fragment
+
+    def parseConcatenation(self):
+        fragment = None
+        while self.peek() not in (None, "|", ")"):
+            nextFragment = self.parseRepetition()
+            if fragment is None:
+                fragment = nextFragment
+            else:
+                self.addRule(fragment[1], 'epsilon', nextFragment[0])
+                fragment = (fragment[0], nextFragment[1])
+        if fragment is None: # empty expression - the empty string
+            stateId = self.newState()
+            fragment = (stateId, stateId)
+        return fragment
+
+    def parseRepetition(self):
+        fragment = self.parseAtom()
+        while self.peek() in ("*", "+", "?"):
+            operator = self.peek()
+            self.position += 1
+            startId = self.newState()
+            acceptId = self.newState()
+            self.addRule(startId, 'epsilon', fragment[0])
+            self.addRule(fragment[1], 'epsilon', acceptId)
+            if operator != "?": # repeat
+                self.addRule(fragment[1], 'epsilon', fragment[0])
+            if operator != "+": # skip
+                self.addRule(startId, 'epsilon', acceptId)
+            fragment = (startId, acceptId)
+        return fragment
+
+    def parseAtom(self):
+        character = self.peek()
+        if character in ("*", "+", "?"):
+            raise RegexError(f"Nothing to repeat before '{character}' at position {self.position} in the regular expression")
+        self.position += 1
+        if character == "(":
+            fragment = self.parseUnion()
+            if self.peek() != ")":
+                raise RegexError("Missing ')' at the end of the regular expression")
+            self.position += 1
+            return fragment
+        if character == "ε":
+            stateId = self.newState()
+            return stateId, stateId
+        if character == "\\":
+            character = self.peek()
+            if character is None:
+                raise RegexError("Regular expression ends with an escape character")
+            self.position += 1
+        self.symbols[character] = None
+        startId = self.newState()
+        acceptId = self.newState()
+        self.addRule(startId, character, acceptId)
+        return startId, acceptId
+
+def convertRegextoNFA(regularExpression, sigma = None):
+    # NFA accepting the strings matched by a regular expression, ready to be used with runNfa (with no separator)
+    # symbols are single characters - | union, * star, + one or more, ? optional, () grouping, ε the empty string,
+    # and \ makes the next character a symbol even if it is an operator (\*, \(, \\, ...)
+    # sigma is the alphabet of the NFA - by default the symbols used in the expression (it must not be empty)
+    parser = RegexParser(regularExpression)
+    startId, acceptId = parser.parse()
+    if sigma is None:
+        sigma = list(parser.symbols)
+    else:
+        sigma = list(sigma)
+        for symbol in parser.symbols:
+            if symbol not in sigma:
+                raise RegexError(f"Symbol '{symbol}' of the regular expression is not in the alphabet")
+    if not sigma:
+        raise UndefinedAlphabetError("Regular expression has no symbols - the alphabet must be given")
+    return getNumberedNFA(parser.numberedRules, startId, [acceptId], sigma, 0)
+
+def getReachableSubsets(compiledNFA):
+    # subset construction that only visits the subsets reachable from the start state, with a worklist,
+    # instead of enumerating the whole power set (2^n subsets)
+    # returns the subsets (as masks, in discovery order - the start subset has id 0)
+    # and dfaTransitions[symbolId][subsetId] = id of the successor subset
+    states, symbolIndex, transitionMasks, startMask, acceptMask = compiledNFA
+
+    subsets = [startMask]
+    subsetIndex = {startMask : 0}
+    dfaTransitions = [[] for symbolMasks in transitionMasks]
+    subsetId = 0
+    while subsetId < len(subsets): # the subsets after subsetId are the ones not expanded yet - the list is the worklist
+        subsetMask = subsets[subsetId]
+        for symbolId, symbolMasks in enumerate(transitionMasks):
+            nextMask = stepMask(subsetMask, symbolMasks)
+            if nextMask not in subsetIndex:
+                subsetIndex[nextMask] = len(subsets)
+                subsets.append(nextMask)
+            dfaTransitions[symbolId].append(subsetIndex[nextMask])
+        subsetId += 1
+    return subsets, dfaTransitions
+
+def getHopcroftPartition(dfaTransitions, isAccepting):
+    # Hopcroft's algorithm - partitions the states of a complete DFA into blocks of equivalent states
+    # (states that accept exactly the same strings)
+    # dfaTransitions[symbolId][stateId] = destination state id, isAccepting[stateId] = bool
+    # returns blockOf[stateId] = block id
+    stateCount = len(isAccepting)
+
+    # inverse transitions - predecessors[symbolId][stateId] = states going to stateId with that symbol
+    predecessors = []
+    for symbolTransitions in dfaTransitions:
+        symbolPredecessors = [[] for stateId in range(stateCount)]
+        for stateId, destinationId in enumerate(symbolTransitions):
+            symbolPredecessors[destinationId].append(stateId)
+        predecessors.append(symbolPredecessors)
+
+    acceptingBlock = {stateId for stateId in range(stateCount) if isAccepting[stateId]}
+    rejectingBlock = set(range(stateCount)) - acceptingBlock
+    blocks = [block for block in (acceptingBlock, rejectingBlock) if block]
+    blockOf = [0] * stateCount
+    for blockId, block in enumerate(blocks):
+        for stateId in block:
+            blockOf[stateId] = blockId
+
+    waiting = set(range(len(blocks))) # splitters still to be processed
+    while waiting:
+        splitterId = waiting.pop()
+        splitter = list(blocks[splitterId]) # copy - the block itself may be split below
+        for symbolPredecessors in predecessors:
+            # states that go into the splitter with this symbol, grouped by their block
+            touchedBlocks = {}
+            for stateId in splitter:
+                for predecessorId in symbolPredecessors[stateId]:
+                    touchedBlocks.setdefault(blockOf[predecessorId], set()).add(predecessorId)
+
+            for blockId, insideStates in touchedBlocks.items():
+                if len(insideStates) == len(blocks[blockId]):
+                    continue # the whole block goes into the splitter - nothing to split
+                blocks[blockId] -= insideStates
+                newBlockId = len(blocks)
+                blocks.append(insideStates)
+                for stateId in insideStates:
+                    blockOf[stateId] = newBlockId
+                if blockId in waiting:
+                    waiting.add(newBlockId) # both halves have to be processed
+                elif len(insideStates) <= len(blocks[blockId]):
+                    waiting.add(newBlockId) # processing only the smaller half is enough
+                else:
+                    waiting.add(blockId)
+    return blockOf
+
+def convertNFAtoDFA(NFA, minimize = True, file_name = None, printReport = True):
+    # powerset construction restricted to the reachable subsets, optionally minimized with Hopcroft's algorithm
+    # the result is a ValidatedNFA in the same format as a NFA (one destination for every state and symbol, no epsilon
+    # transitions), so it can be run with runNfa and written with generateDefinitionNFAFile
+    # DFA states are named after the subset of NFA states they stand for, with getSortedSetString - a block of
+    # equivalent subsets is named after the first subset of it that was discovered
+    states, sigma, rules, start, accept = NFA
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+
+    compiledNFA = getCompiledNfa(NFA)
+    acceptMask = compiledNFA[4]
+    subsets, dfaTransitions = getReachableSubsets(compiledNFA)
+    isAccepting = [subsetMask & acceptMask != 0 for subsetMask in subsets]
+
+    if minimize:
+        blockOf = getHopcroftPartition(dfaTransitions, isAccepting)
+    else:
+        blockOf = list(range(len(subsets))) # every subset is its own block
+
+    # representative of every block = the first subset discovered in it, so the start subset (id 0) is always one
+    representatives = []
+    names = {} # names[blockId] = DFA state name
+    for subsetId, blockId in enumerate(blockOf):
+        if blockId not in names:
+            names[blockId] = getSortedSetString(getStatesFromMask(subsets[subsetId], states))
+            representatives.append(subsetId)
 
-def convertNFAtoDFA(NFA): # using powerset construction
-    states, sigma, rules, start, accept = NFA # getting values from 5-tuple
-    # first of all we will compute the start state for the new DFA, which will be the subset
-    # formed by the previous start state and all the epsilon transitions from it
-    startSet = set([start]) # set containing just the NFA’s start state - the getEpsilonStatesSetMaxDepth function requires a set as it's first argument
-    epsilonTransitionsFromStartState = getEpsilonStatesSetMaxDepth(startSet, rules) 
-    print(getSortedSetString(epsilonTransitionsFromStartState))
     DFAStates = []
-    powerSet = getPowerSet(states)
-    for subset in powerSet:
-        DFAStates.append(getSortedSetString(subset))
-        print(getSortedSetString(subset))
-'''
+    DFARules = {}
+    DFAAccept = []
+    for subsetId in representatives:
+        sourceState = names[blockOf[subsetId]]
+        DFAStates.append(sourceState)
+        DFARules[sourceState] = {}
+        for symbolId, symbol in enumerate(sigma):
+            DFARules[sourceState][symbol] = {names[blockOf[dfaTransitions[symbolId][subsetId]]]}
+        if isAccepting[subsetId]:
+            DFAAccept.append(sourceState)
+    DFAStart = names[blockOf[0]]
+    if not DFAAccept: # the NFA accepts nothing - a NFA needs an accept state, so one is added, unreachable and without rules
+        DFAAccept.append(getSortedSetString([accept[0]])) # can't be the name of a DFA state - it would be accepting
+        DFAStates.append(DFAAccept[0])
+
+    if printReport == True:
+        print(f"NFA states : {len(states)}")
+        print(f"DFA states (reachable subsets) : {len(subsets)}")
+        if minimize:
+            print(f"DFA states after minimization : {len(representatives)}")
+
+    DFA = ValidatedNFA((DFAStates, list(sigma), DFARules, DFAStart, DFAAccept)) # compiled once, by its first run
+    if file_name is not None:
+        generateDefinitionNFAFile(DFA, file_name)
+    return DFA
+
+# reduction passes - every pass returns a new NFA (not modifying the one given) accepting the same strings,
+# with fewer states or transitions, so that fewer states are active at every step of runNfa
+# missing rules keep meaning "stay in the same state", so a rule can't just be dropped when its destinations are
+# removed - where that would leave a state without destinations, a sink state (no rules, not accepting) is used
+
+def getTransitionCount(NFA):
+    # number of (source state, symbol, destination state) triples in the rules, epsilon rules included
+    states, sigma, rules, start, accept = NFA
+    return sum(len(destinationStates) for stateRules in rules.values() for destinationStates in stateRules.values())
+
+def removeUnreachableStates(NFA):
+    # drops the states that can't be reached from the start state (with any symbols or epsilon transitions)
+    states, sigma, rules, start, accept = NFA
+    reachableStates = {start}
+    statesToVisit = [start]
+    while statesToVisit:
+        for destinationStates in rules.get(statesToVisit.pop(), {}).values():
+            for destinationState in destinationStates:
+                if destinationState not in reachableStates:
+                    reachableStates.add(destinationState)
+                    statesToVisit.append(destinationState)
+
+    newAccept = [acceptState for acceptState in accept if acceptState in reachableStates]
+    keptStates = set(reachableStates)
+    if not newAccept: # the NFA accepts nothing - a NFA needs an accept state, so one is kept, unreachable and without rules
+        newAccept = [accept[0]]
+        keptStates.add(accept[0])
+    newStates = [state for state in states if state in keptStates]
+    newRules = {}
+    for state in newStates:
+        if state in reachableStates and state in rules:
+            newRules[state] = {symbol : set(destinationStates) for symbol, destinationStates in rules[state].items()}
+    return ValidatedNFA((newStates, list(sigma), newRules, start, newAccept))
+
+def removeDeadStates(NFA):
+    # drops the states from which no accept state can be reached - they are all replaced by a single sink state,
+    # which is only kept if some rule would have no destinations left without it (or if the start state is dead)
+    states, sigma, rules, start, accept = NFA
+    predecessors = {}
+    for sourceState, stateRules in rules.items():
+        for destinationStates in stateRules.values():
+            for destinationState in destinationStates:
+                predecessors.setdefault(destinationState, []).append(sourceState)
+    liveStates = set(accept)
+    statesToVisit = list(accept)
+    while statesToVisit:
+        for predecessorState in predecessors.get(statesToVisit.pop(), ()):
+            if predecessorState not in liveStates:
+                liveStates.add(predecessorState)
+                statesToVisit.append(predecessorState)
+
+    deadStates = [state for state in states if state not in liveStates]
+    if not deadStates:
+        return ValidatedNFA(NFA)
+    sinkState = start if start not in liveStates else deadStates[0]
+    isSinkUsed = start not in liveStates
+
+    newRules = {}
+    for state in states:
+        if state not in liveStates or state not in rules:
+            continue
+        stateRules = {}
+        for symbol, destinationStates in rules[state].items():
+            liveDestinations = {destinationState for destinationState in destinationStates if destinationState in liveStates}
+            if not liveDestinations:
+                if symbol == 'epsilon': # an epsilon rule to dead states only adds nothing
+                    continue
+                liveDestinations = {sinkState}
+                isSinkUsed = True
+            stateRules[symbol] = liveDestinations
+        newRules[state] = stateRules
+    newStates = [state for state in states if state in liveStates or (isSinkUsed and state == sinkState)]
+    return ValidatedNFA((newStates, list(sigma), newRules, start, list(accept)))
+
+def removeEpsilonTransitions(NFA):
+    # equivalent NFA without epsilon transitions - the closures are folded into the rules:
+    # δ'(s, a) = closure(step(closure({s}), a)), and s is an accept state if closure({s}) has an accept state
+    # (rules that would be {s} are left out, since that is what a missing rule means)
+    states, sigma, rules, start, accept = NFA
+    stateIndex = {state : stateId for stateId, state in enumerate(states)}
+    closureMasks = getEpsilonClosureMasks(states, rules, stateIndex)
+    transitionMasks = getCompiledNfa(NFA)[2] # already closure(step({s}, a)) for every single state s
+
+    newRules = {}
+    for stateId, state in enumerate(states):
+        stateRules = {}
+        for symbolId, symbol in enumerate(sigma):
+            nextMask = stepMask(closureMasks[stateId], transitionMasks[symbolId])
+            if nextMask != 1 << stateId:
+                stateRules[symbol] = getStatesFromMask(nextMask, states)
+        if stateRules:
+            newRules[state] = stateRules
+
+    acceptMask = 0
+    for acceptState in accept:
+        acceptMask |= 1 << stateIndex[acceptState]
+    newAccept = [state for stateId, state in enumerate(states) if closureMasks[stateId] & acceptMask]
+    return ValidatedNFA((list(states), list(sigma), newRules, start, newAccept))
+
+def mergeBisimilarStates(NFA):
+    # merges the states that are equivalent under (forward) bisimulation: both accept or both don't, and for every
+    # symbol their destinations fall in the same blocks of equivalent states - found by refining the
+    # accept/non accept partition until it doesn't change
+    # the rules of a block are those of its first state, which also names it
+    # epsilon transitions are removed first
+    if any('epsilon' in stateRules for stateRules in NFA[2].values()):
+        NFA = removeEpsilonTransitions(NFA)
+    states, sigma, rules, start, accept = NFA
+    compiledNFA = getCompiledNfa(NFA)
+    transitionMasks = compiledNFA[2] # missing rules already turned into "stay" here
+    acceptMask = compiledNFA[4]
+
+    destinationIds = [[] for symbolMasks in transitionMasks]
+    for symbolId, symbolMasks in enumerate(transitionMasks):
+        for destinationMask in symbolMasks:
+            stateIds = []
+            while destinationMask:
+                lowestBit = destinationMask & -destinationMask
+                stateIds.append(lowestBit.bit_length() - 1)
+                destinationMask ^= lowestBit
+            destinationIds[symbolId].append(stateIds)
+
+    blockOf = [acceptMask >> stateId & 1 for stateId in range(len(states))]
+    blockCount = len(set(blockOf))
+    while True:
+        signatures = {} # (block, destination blocks mask for every symbol) -> new block id
+        newBlockOf = []
+        for stateId in range(len(states)):
+            signature = [blockOf[stateId]]
+            for symbolDestinationIds in destinationIds:
+                blocksMask = 0
+                for destinationId in symbolDestinationIds[stateId]:
+                    blocksMask |= 1 << blockOf[destinationId]
+                signature.append(blocksMask)
+            newBlockOf.append(signatures.setdefault(tuple(signature), len(signatures)))
+        blockOf = newBlockOf
+        if len(signatures) == blockCount: # no block was split
+            break
+        blockCount = len(signatures)
+
+    names = {} # block id -> name of its first state
+    for stateId, state in enumerate(states):
+        names.setdefault(blockOf[stateId], state)
+    newRules = {}
+    for stateId, state in enumerate(states):
+        if names[blockOf[stateId]] != state:
+            continue
+        stateRules = {}
+        for symbolId, symbol in enumerate(sigma):
+            destinationNames = {names[blockOf[destinationId]] for destinationId in destinationIds[symbolId][stateId]}
+            if destinationNames != {state}:
+                stateRules[symbol] = destinationNames
+        if stateRules:
+            newRules[state] = stateRules
+    newStates = list(names.values())
+    acceptSet = set(accept)
+    newAccept = [state for state in newStates if state in acceptSet]
+    startId = states.index(start)
+    return ValidatedNFA((newStates, list(sigma), newRules, names[blockOf[startId]], newAccept))
+
+def reduceNfa(NFA, printReport = True):
+    # runs all the reduction passes, in an order where each one helps the next: removing the epsilon transitions
+    # can leave states that were only reachable through them unreachable, and merging works best without dead states
+    if not isNfaValid(NFA):
+        raise NFAError("NFA not valid")
+    reductionPasses = [removeUnreachableStates, removeEpsilonTransitions, removeUnreachableStates,
+                       removeDeadStates, mergeBisimilarStates]
+    for reductionPass in reductionPasses:
+        reducedNFA = reductionPass(NFA)
+        if printReport == True:
+            print(f"{reductionPass.__name__} : {len(NFA[0])} states, {getTransitionCount(NFA)} transitions -> "
+                  f"{len(reducedNFA[0])} states, {getTransitionCount(reducedNFA)} transitions")
+        NFA = reducedNFA
+    return NFA
+
 def generateDefinitionNFAFile(NFA, file_name="nfa_definition.txt"):
     states, sigma, rules, start, accept = NFA  # unpack the NFA components
     
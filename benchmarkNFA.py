@@ -0,0 +1,184 @@
+import NFA as automaton
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+# benchmarks for the NFA module
+# python3 benchmarkNFA.py parse OPTIONAL(ruleCount) OPTIONAL(stateCount)
+#   generates a definition file with ruleCount rules (1 000 000 by default) and times parseFile on it
+# python3 benchmarkNFA.py suite OPTIONS
+#   times parseFile, isNfaValid, runNfa (verbose and quiet), the epsilon closures and convertNFAtoDFA on generated
+#   automata and inputs - options (--name=value): --states, --alphabet, --fanout, --epsilon, --chain, --length,
+#   --seed, --repeats, and --json=FILE to also write the results as JSON
+# python3 benchmarkNFA.py compare OLD.json NEW.json
+#   prints the change of every benchmark between two JSON result files (e.g. written before and after a commit)
+
+def generateDefinitionFile(fileName, stateCount, ruleCount, alphabetSize = 2, seed = 0):
+    # writes a random NFA definition file in the same format parseFile reads, with comments and epsilon rules mixed in
+    randomGenerator = random.Random(seed)
+    states = [f"q{stateId}" for stateId in range(stateCount)]
+    sigma = [str(symbolId) for symbolId in range(alphabetSize)]
+    with open(fileName, "w", encoding = "utf-8") as file:
+        file.write("# generated by benchmarkNFA.py\n")
+        file.write("[States]\n")
+        for state in states:
+            file.write(f"{state}\n")
+        file.write("End\n\n[Sigma]\n")
+        for symbol in sigma:
+            file.write(f"{symbol}\n")
+        file.write("End\n\n[Rules]\n/* rules are\n   randomly generated */\n")
+        for ruleNumber in range(ruleCount):
+            symbol = randomGenerator.choice(sigma) if ruleNumber % 10 else "ε"
+            comment = " # comment" if ruleNumber % 100 == 0 else ""
+            file.write(f"{randomGenerator.choice(states)}, {symbol}, {randomGenerator.choice(states)}{comment}\n")
+        file.write("End\n\n[Start]\nq0\nEnd\n\n[Accept]\n")
+        file.write(f"{states[-1]}\nEnd\n")
+
+def generateAutomaton(stateCount = 100, alphabetSize = 2, fanout = 2, epsilonDensity = 0.1, chainDepth = 0, seed = 0):
+    # random NFA 5-tuple with the given shape:
+    # fanout          - number of destinations of every (state, symbol) rule (nondeterminism)
+    # epsilonDensity  - probability that a state has an epsilon rule to a random state
+    # chainDepth      - length of an extra chain of epsilon rules q0 -> q1 -> ... (deep epsilon closures)
+    # about one state in ten is an accept state
+    randomGenerator = random.Random(seed)
+    states = [f"q{stateId}" for stateId in range(stateCount)]
+    sigma = [str(symbolId) for symbolId in range(alphabetSize)]
+    rules = {}
+    for state in states:
+        rules[state] = {symbol : set(randomGenerator.sample(states, min(fanout, stateCount))) for symbol in sigma}
+        if randomGenerator.random() < epsilonDensity:
+            rules[state]['epsilon'] = {randomGenerator.choice(states)}
+    for stateId in range(min(chainDepth, stateCount - 1)):
+        rules[states[stateId]].setdefault('epsilon', set()).add(states[stateId + 1])
+    accept = [state for state in states if randomGenerator.random() < 0.1] or [states[-1]]
+    return states, sigma, rules, states[0], accept
+
+def generateInput(sigma, length, stringSeparator = "", seed = 0):
+    # random input string of length symbols of sigma
+    randomGenerator = random.Random(seed)
+    return stringSeparator.join(randomGenerator.choice(sigma) for symbolNumber in range(length))
+
+def timeFunction(function, repeats = 1):
+    # best wall clock time out of repeats runs, in seconds
+    bestTime = None
+    for repeat in range(repeats):
+        startTime = time.perf_counter()
+        function()
+        elapsedTime = time.perf_counter() - startTime
+        if bestTime is None or elapsedTime < bestTime:
+            bestTime = elapsedTime
+    return bestTime
+
+def benchmarkParser(ruleCount = 1000000, stateCount = 1000, repeats = 3):
+    with tempfile.TemporaryDirectory() as directory:
+        fileName = os.path.join(directory, "benchmark_definition.txt")
+        generateDefinitionFile(fileName, stateCount, ruleCount)
+        fileSize = os.path.getsize(fileName)
+        parseTime = timeFunction(lambda: automaton.parseFile(open(fileName, "r", encoding = "utf-8")), repeats)
+    print(f"parseFile : {ruleCount} rules, {stateCount} states, {fileSize / 1e6:.1f} MB")
+    print(f"  {parseTime:.3f} s ({ruleCount / parseTime:,.0f} rules/s)")
+    return parseTime
+
+def runSuite(stateCount = 100, alphabetSize = 2, fanout = 2, epsilonDensity = 0.1, chainDepth = 50, inputLength = 100000,
+             seed = 0, repeats = 3):
+    # times every benchmark on the same generated automaton and input - returns a list of results,
+    # {"name", "seconds", "items", "unit"}, where items / seconds is the throughput in units per second
+    NFA = generateAutomaton(stateCount, alphabetSize, fanout, epsilonDensity, chainDepth, seed)
+    states, sigma, rules, start, accept = NFA
+    inputString = generateInput(sigma, inputLength, "", seed)
+    ruleCount = sum(len(destinationStates) for stateRules in rules.values() for destinationStates in stateRules.values())
+    results = []
+
+    def addResult(name, function, items, unit, repeatCount = repeats):
+        seconds = timeFunction(function, repeatCount)
+        results.append({"name" : name, "seconds" : seconds, "items" : items, "unit" : unit})
+        print(f"{name:<24} {seconds:10.4f} s  {items / seconds:>16,.0f} {unit}/s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        fileName = os.path.join(directory, "benchmark_definition.txt")
+        with contextlib.redirect_stdout(io.StringIO()): # generateDefinitionNFAFile prints the file name
+            automaton.generateDefinitionNFAFile(NFA, fileName)
+        addResult("parseFile", lambda: automaton.parseFile(open(fileName, "r", encoding = "utf-8")), ruleCount, "rules")
+
+    addResult("isNfaValid", lambda: automaton.isNfaValid(NFA), ruleCount, "rules") # a plain tuple is checked every time
+    addResult("epsilonClosureTable", lambda: automaton.getEpsilonClosureTable(states, rules), stateCount, "states")
+    addResult("compileNfa", lambda: automaton.compileNfa(NFA), ruleCount, "rules")
+
+    validatedNFA = automaton.ValidatedNFA(NFA)
+    # cold - a new ValidatedNFA every time, so compiling and filling the lazy DFA cache are included
+    addResult("runNfa quiet (cold)", lambda: automaton.runNfa(automaton.ValidatedNFA(NFA), inputString, "", False),
+              inputLength, "symbols")
+    addResult("runNfa quiet (warm)", lambda: automaton.runNfa(validatedNFA, inputString, "", False), inputLength, "symbols")
+    verboseLength = min(inputLength, 2000) # every step is printed - a shorter input keeps it reasonable
+    def runVerbose():
+        with contextlib.redirect_stdout(io.StringIO()): # the steps are printed to memory, not to the terminal
+            automaton.runNfa(validatedNFA, inputString[:verboseLength], "", True)
+    addResult("runNfa verbose", runVerbose, verboseLength, "symbols", 1)
+    addResult("convertNFAtoDFA", lambda: automaton.convertNFAtoDFA(validatedNFA, printReport = False), stateCount, "states", 1)
+    return results
+
+def getCommit():
+    # current git commit of the repository, or None outside a git checkout
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output = True, text = True,
+                              cwd = os.path.dirname(os.path.abspath(__file__)), check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def writeResults(fileName, parameters, results):
+    report = {"commit" : getCommit(), "python" : platform.python_version(), "time" : time.strftime("%Y-%m-%d %H:%M:%S"),
+              "parameters" : parameters, "results" : results}
+    with open(fileName, "w", encoding = "utf-8") as file:
+        json.dump(report, file, indent = 2)
+
+def compareResults(oldFileName, newFileName):
+    # prints new time / old time for every benchmark found in both files (below 1 - faster, above 1 - slower)
+    with open(oldFileName, encoding = "utf-8") as file:
+        oldReport = json.load(file)
+    with open(newFileName, encoding = "utf-8") as file:
+        newReport = json.load(file)
+    oldParameters = dict(oldReport["parameters"], repeats = None)
+    if oldParameters != dict(newReport["parameters"], repeats = None):
+        print("warning: the two files were made with different parameters")
+    oldSeconds = {result["name"] : result["seconds"] for result in oldReport["results"]}
+    print(f"{oldReport['commit']} -> {newReport['commit']}")
+    for result in newReport["results"]:
+        if result["name"] in oldSeconds:
+            ratio = result["seconds"] / oldSeconds[result["name"]]
+            print(f"{result['name']:<24} {oldSeconds[result['name']]:10.4f} s -> {result['seconds']:10.4f} s  x{ratio:.2f}")
+
+if __name__ == "__main__":
+    options = [argument for argument in sys.argv[1:] if argument.startswith("--")]
+    arguments = [argument for argument in sys.argv[1:] if not argument.startswith("--")]
+    optionValues = dict(option[2:].split("=", 1) for option in options if "=" in option)
+
+    if arguments and arguments[0] == "parse":
+        ruleCount = int(arguments[1]) if len(arguments) >= 2 else 1000000
+        stateCount = int(arguments[2]) if len(arguments) >= 3 else 1000
+        benchmarkParser(ruleCount, stateCount)
+    elif arguments and arguments[0] == "suite":
+        parameters = {"stateCount" : int(optionValues.get("states", 100)),
+                      "alphabetSize" : int(optionValues.get("alphabet", 2)),
+                      "fanout" : int(optionValues.get("fanout", 2)),
+                      "epsilonDensity" : float(optionValues.get("epsilon", 0.1)),
+                      "chainDepth" : int(optionValues.get("chain", 50)),
+                      "inputLength" : int(optionValues.get("length", 100000)),
+                      "seed" : int(optionValues.get("seed", 0)),
+                      "repeats" : int(optionValues.get("repeats", 3))}
+        results = runSuite(**parameters)
+        if "json" in optionValues:
+            writeResults(optionValues["json"], parameters, results)
+    elif len(arguments) == 3 and arguments[0] == "compare":
+        compareResults(arguments[1], arguments[2])
+    else:
+        print("usage: python3 benchmarkNFA.py parse [ruleCount] [stateCount]")
+        print("       python3 benchmarkNFA.py suite [--states=N] [--alphabet=N] [--fanout=N] [--epsilon=P] [--chain=N]")
+        print("                                     [--length=N] [--seed=N] [--repeats=N] [--json=FILE]")
+        print("       python3 benchmarkNFA.py compare OLD.json NEW.json")
@@ -0,0 +1,325 @@
+import NFA as automaton
+import hashlib
+import io
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# binary cache of parsed and compiled NFAs
+# a definition file is parsed and validated once, then stored next to it (in a __nfacache__ folder) in a compact binary
+# format, and later loads read the binary file instead of parsing the text again
+# the cache file records the definition's modification time, size and SHA-256 hash - if the modification time and size
+# still match it is used directly, if only the time changed the hash decides, otherwise the definition is parsed again
+#
+# binary format (little-endian, every section padded to 4 bytes):
+#   header                  - see HEADER_FORMAT
+#   stateNameOffsets        - u32[stateCount + 1], offsets of every state name in stateNames
+#   symbolNameOffsets       - u32[symbolCount + 1], offsets of every symbol in symbolNames
+#   acceptIds               - u32[acceptCount]
+#   transitionOffsets       - u32[stateCount * (symbolCount + 1) + 1], CSR rows - row stateId * (symbolCount + 1) + symbolId,
+#                             the last symbol slot of every state (symbolId = symbolCount) holds the epsilon transitions
+#   transitionDestinations  - u32[transitionCount]
+#   closureOffsets          - u32[stateCount + 1], CSR rows of the precomputed epsilon closures
+#   closureStates           - u32[closureCount]
+#   stateNames, symbolNames - UTF-8 text
+#   transitionMaskBits      - the compiled transition masks (see compileNfa), maskRowLength bytes per (symbol, state),
+#                             little-endian bitmaps - only stored when they are not too big (maskRowLength = 0 otherwise),
+#                             loading them is a single int.from_bytes per mask
+
+CACHE_FOLDER = "__nfacache__"
+CACHE_EXTENSION = ".nfac"
+MAGIC = b"NFAC"
+FORMAT_VERSION = 1
+HEADER_FORMAT = "<4sIqQ32sIIIIIIIII" # magic, version, source mtime (ns), source size, source sha256, stateCount, symbolCount,
+                                     # startId, acceptCount, stateNamesLength, symbolNamesLength, transitionCount, closureCount,
+                                     # maskRowLength
+MAX_MASK_SECTION_SIZE = 64 << 20 # bytes - dense masks grow with stateCount^2, larger NFAs are compiled from the CSR arrays
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+class CacheFormatError(Exception):
+    # raised when a cache file is damaged or was written by a different version of the format
+    pass
+
+def getFileHash(fileName):
+    fileHash = hashlib.sha256()
+    with open(fileName, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            fileHash.update(block)
+    return fileHash.digest()
+
+def getCacheFileName(definitionFileName):
+    folder, name = os.path.split(definitionFileName)
+    return os.path.join(folder, CACHE_FOLDER, name + CACHE_EXTENSION)
+
+def getPaddingLength(length):
+    return -length % 4
+
+def getPadding(length):
+    return b"\0" * getPaddingLength(length)
+
+def toLittleEndianBytes(values):
+    values = array("I", values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+def writeCache(NFA, cacheFileName, sourceMtimeNs, sourceSize, sourceHash):
+    states, sigma, rules, start, accept = NFA
+    stateIndex = {state : stateId for stateId, state in enumerate(states)}
+    symbolSlots = list(sigma) + ["epsilon"]
+
+    transitionOffsets = [0]
+    transitionDestinations = []
+    for state in states:
+        stateRules = rules.get(state, {})
+        for symbol in symbolSlots:
+            for destinationState in stateRules.get(symbol, ()):
+                transitionDestinations.append(stateIndex[destinationState])
+            transitionOffsets.append(len(transitionDestinations))
+
+    closureTable = automaton.getEpsilonClosureTable(states, rules)
+    closureOffsets = [0]
+    closureStates = []
+    for state in states:
+        closureStates.extend(sorted(stateIndex[epsilonState] for epsilonState in closureTable[state]))
+        closureOffsets.append(len(closureStates))
+
+    def getNameTable(names):
+        offsets = [0]
+        encodedNames = bytearray()
+        for name in names:
+            encodedNames += name.encode("utf-8")
+            offsets.append(len(encodedNames))
+        return offsets, bytes(encodedNames)
+
+    stateNameOffsets, stateNames = getNameTable(states)
+    symbolNameOffsets, symbolNames = getNameTable(sigma)
+
+    maskRowLength = (len(states) + 7) // 8
+    transitionMaskBits = b""
+    if len(sigma) * len(states) * maskRowLength <= MAX_MASK_SECTION_SIZE:
+        transitionMasks = automaton.getCompiledNfa(NFA)[2]
+        transitionMaskBits = b"".join(nextMask.to_bytes(maskRowLength, "little")
+                                      for symbolMasks in transitionMasks for nextMask in symbolMasks)
+    else:
+        maskRowLength = 0
+
+    header = struct.pack(HEADER_FORMAT, MAGIC, FORMAT_VERSION, sourceMtimeNs, sourceSize, sourceHash,
+                         len(states), len(sigma), stateIndex[start], len(accept), len(stateNames), len(symbolNames),
+                         len(transitionDestinations), len(closureStates), maskRowLength)
+    sections = [header,
+                toLittleEndianBytes(stateNameOffsets), toLittleEndianBytes(symbolNameOffsets),
+                toLittleEndianBytes(stateIndex[acceptState] for acceptState in accept),
+                toLittleEndianBytes(transitionOffsets), toLittleEndianBytes(transitionDestinations),
+                toLittleEndianBytes(closureOffsets), toLittleEndianBytes(closureStates),
+                stateNames + getPadding(len(stateNames)), symbolNames + getPadding(len(symbolNames)),
+                transitionMaskBits]
+
+    os.makedirs(os.path.dirname(cacheFileName) or ".", exist_ok = True)
+    temporaryFileName = cacheFileName + f".{os.getpid()}.tmp"
+    with open(temporaryFileName, "wb") as file:
+        for section in sections:
+            file.write(section)
+    os.replace(temporaryFileName, cacheFileName) # atomic - a reader never sees a half written cache file
+
+def readCacheHeader(cacheFileName):
+    with open(cacheFileName, "rb") as file:
+        headerBytes = file.read(HEADER_SIZE)
+    if len(headerBytes) != HEADER_SIZE:
+        raise CacheFormatError(f"Cache file {cacheFileName} is truncated")
+    header = struct.unpack(HEADER_FORMAT, headerBytes)
+    if header[0] != MAGIC or header[1] != FORMAT_VERSION:
+        raise CacheFormatError(f"Cache file {cacheFileName} has an unknown format")
+    return header
+
+def updateCacheMtime(cacheFileName, sourceMtimeNs):
+    # the definition was touched but its contents are the same - only the recorded modification time changes
+    with open(cacheFileName, "r+b") as file:
+        file.seek(struct.calcsize("<4sI"))
+        file.write(struct.pack("<q", sourceMtimeNs))
+
+def loadCache(cacheFileName, expectedHash = None):
+    # maps the cache file and reads the arrays straight from the mapping (memoryview.cast - no copy, no parsing),
+    # then builds the NFA 5-tuple and its compiled form from them
+    # expectedHash - SHA-256 hash of the definition the cache must have been written from, checked in the same
+    # mapping the NFA is read from
+    with open(cacheFileName, "rb") as file:
+        fileMap = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+    fileView = None
+    views = []
+    destinationIds = None
+    try:
+        header = struct.unpack_from(HEADER_FORMAT, fileMap, 0)
+        (magic, version, sourceMtimeNs, sourceSize, sourceHash, stateCount, symbolCount, startId, acceptCount,
+         stateNamesLength, symbolNamesLength, transitionCount, closureCount, maskRowLength) = header
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise CacheFormatError(f"Cache file {cacheFileName} has an unknown format")
+        if expectedHash is not None and sourceHash != expectedHash:
+            raise CacheFormatError(f"Cache file {cacheFileName} was written from other contents")
+        # the size of every section is known from the header - checked before anything is read, so a truncated file
+        # is found here and not by a slice or a cast in the middle of the mapping
+        arrayLength = ((stateCount + 1) + (symbolCount + 1) + acceptCount + (stateCount * (symbolCount + 1) + 1) +
+                       transitionCount + (stateCount + 1) + closureCount)
+        fileLength = (HEADER_SIZE + 4 * arrayLength + stateNamesLength + getPaddingLength(stateNamesLength) +
+                      symbolNamesLength + getPaddingLength(symbolNamesLength) + symbolCount * stateCount * maskRowLength)
+        if fileLength != len(fileMap):
+            raise CacheFormatError(f"Cache file {cacheFileName} is truncated or damaged")
+
+        fileView = memoryview(fileMap)
+        position = HEADER_SIZE
+        def getArray(length):
+            nonlocal position
+            view = fileView[position : position + 4 * length]
+            position += 4 * length
+            if sys.byteorder == "big": # the file is little-endian - the values have to be copied and swapped
+                values = array("I", view)
+                values.byteswap()
+                return values
+            view = view.cast("I")
+            views.append(view)
+            return view
+        def getBytes(length):
+            nonlocal position
+            text = bytes(fileView[position : position + length])
+            position += length + getPaddingLength(length)
+            return text
+
+        stateNameOffsets = getArray(stateCount + 1)
+        symbolNameOffsets = getArray(symbolCount + 1)
+        acceptIds = getArray(acceptCount)
+        transitionOffsets = getArray(stateCount * (symbolCount + 1) + 1)
+        transitionDestinations = getArray(transitionCount)
+        closureOffsets = getArray(stateCount + 1)
+        closureStates = getArray(closureCount)
+        stateNamesBytes = getBytes(stateNamesLength)
+        symbolNamesBytes = getBytes(symbolNamesLength)
+        maskBitsStart = position
+        # the last offset of every CSR table is the size of what it indexes
+        if (stateNameOffsets[stateCount] != stateNamesLength or symbolNameOffsets[symbolCount] != symbolNamesLength or
+            transitionOffsets[-1] != transitionCount or closureOffsets[stateCount] != closureCount):
+            raise CacheFormatError(f"Cache file {cacheFileName} is damaged")
+
+        # offsets are byte offsets in the UTF-8 text - the names are decoded one by one
+        states = [stateNamesBytes[stateNameOffsets[stateId] : stateNameOffsets[stateId + 1]].decode("utf-8")
+                  for stateId in range(stateCount)]
+        sigma = [symbolNamesBytes[symbolNameOffsets[symbolId] : symbolNameOffsets[symbolId + 1]].decode("utf-8")
+                 for symbolId in range(symbolCount)]
+        symbolSlots = sigma + ["epsilon"]
+
+        def getClosureMask(stateId):
+            closureMask = 0
+            for epsilonStateId in closureStates[closureOffsets[stateId] : closureOffsets[stateId + 1]]:
+                closureMask |= 1 << epsilonStateId
+            return closureMask
+
+        rules = {}
+        getStateName = states.__getitem__
+        for stateId in range(stateCount):
+            rowStart = stateId * (symbolCount + 1)
+            for symbolId, symbol in enumerate(symbolSlots):
+                destinationIds = transitionDestinations[transitionOffsets[rowStart + symbolId] : transitionOffsets[rowStart + symbolId + 1]]
+                if len(destinationIds) > 0:
+                    rules.setdefault(states[stateId], {})[symbol] = frozenset(map(getStateName, destinationIds))
+
+        if maskRowLength > 0: # compiled masks stored in the file
+            transitionMasks = []
+            maskPosition = maskBitsStart
+            for symbolId in range(symbolCount):
+                symbolMasks = []
+                for stateId in range(stateCount):
+                    symbolMasks.append(int.from_bytes(fileView[maskPosition : maskPosition + maskRowLength], "little"))
+                    maskPosition += maskRowLength
+                transitionMasks.append(symbolMasks)
+        else: # compiled from the CSR arrays and the stored closures
+            closureMasks = [getClosureMask(stateId) for stateId in range(stateCount)]
+            transitionMasks = [[0] * stateCount for symbol in sigma]
+            for stateId in range(stateCount):
+                rowStart = stateId * (symbolCount + 1)
+                for symbolId in range(symbolCount):
+                    destinationIds = transitionDestinations[transitionOffsets[rowStart + symbolId] : transitionOffsets[rowStart + symbolId + 1]]
+                    if len(destinationIds) == 0:
+                        transitionMasks[symbolId][stateId] = closureMasks[stateId] # no rule - the NFA stays in the same state
+                    else:
+                        nextMask = 0
+                        for destinationId in destinationIds:
+                            nextMask |= closureMasks[destinationId]
+                        transitionMasks[symbolId][stateId] = nextMask
+        startMask = getClosureMask(startId)
+
+        acceptMask = 0
+        for acceptId in acceptIds:
+            acceptMask |= 1 << acceptId
+        accept = [states[acceptId] for acceptId in acceptIds]
+        start = states[startId]
+    finally:
+        # every view of the mapping has to be released before it is closed - also when the file turned out to be damaged
+        destinationIds = None # the last slice of the mapping still referenced
+        for view in views:
+            view.release()
+        if fileView is not None:
+            fileView.release()
+        fileMap.close()
+
+    NFA = automaton.ValidatedNFA((states, sigma, rules, start, accept), isTrusted = True) # validated before it was cached
+    NFA.compiledNFA = (NFA[0], {symbol : symbolId for symbolId, symbol in enumerate(sigma)}, transitionMasks,
+                       startMask, acceptMask)
+    return NFA
+
+def loadNfa(definitionFileName, useCache = True):
+    # returns the ValidatedNFA of a definition file, from the binary cache if it is up to date,
+    # otherwise by parsing the file (and then writing the cache for the next time)
+    if not useCache:
+        with open(definitionFileName, "r") as definitionFile: # closed even when parseFile raises
+            return automaton.parseFile(definitionFile)
+
+    cacheFileName = getCacheFileName(definitionFileName)
+    sourceStatus = os.stat(definitionFileName)
+    sourceHash = None
+    try:
+        header = readCacheHeader(cacheFileName)
+        cachedMtimeNs, cachedSize, cachedHash = header[2], header[3], header[4]
+        if cachedSize == sourceStatus.st_size:
+            if cachedMtimeNs == sourceStatus.st_mtime_ns:
+                return loadCache(cacheFileName)
+            sourceHash = getFileHash(definitionFileName)
+            if sourceHash == cachedHash: # same contents, only the modification time changed
+                updateCacheMtime(cacheFileName, sourceStatus.st_mtime_ns)
+                return loadCache(cacheFileName)
+    except Exception:
+        pass # no cache yet, or an unusable one (truncated, damaged, other format) - it is rebuilt below
+
+    with open(definitionFileName, "r") as definitionFile:
+        NFA = automaton.parseFile(definitionFile)
+    if sourceHash is None:
+        sourceHash = getFileHash(definitionFileName)
+    try:
+        writeCache(NFA, cacheFileName, sourceStatus.st_mtime_ns, sourceStatus.st_size, sourceHash)
+    except OSError:
+        pass # a read-only folder only means no cache - the NFA itself is fine
+    return NFA
+
+def loadNfaFromSource(definitionFileName, useCache = True):
+    # like loadNfa, but the definition file is read only once and the NFA is the one of exactly the contents read -
+    # returns (NFA, modification time (ns) of the file when it was opened, size and SHA-256 hash of those contents),
+    # so that a caller comparing them with the file later (see registryNFA.py) can't keep the NFA of older contents
+    # than the ones it recorded, even if the file changes while it is being loaded
+    with open(definitionFileName, "rb") as definitionFile:
+        sourceMtimeNs = os.fstat(definitionFile.fileno()).st_mtime_ns
+        sourceBytes = definitionFile.read()
+    sourceHash = hashlib.sha256(sourceBytes).digest()
+    if not useCache:
+        return automaton.parseFile(io.TextIOWrapper(io.BytesIO(sourceBytes))), sourceMtimeNs, len(sourceBytes), sourceHash
+
+    cacheFileName = getCacheFileName(definitionFileName)
+    try:
+        return loadCache(cacheFileName, sourceHash), sourceMtimeNs, len(sourceBytes), sourceHash
+    except Exception:
+        pass # no cache yet, or one of other contents or unusable - it is rebuilt below
+    NFA = automaton.parseFile(io.TextIOWrapper(io.BytesIO(sourceBytes))) # decoded like open(definitionFileName, "r")
+    try:
+        writeCache(NFA, cacheFileName, sourceMtimeNs, len(sourceBytes), sourceHash)
+    except OSError:
+        pass
+    return NFA, sourceMtimeNs, len(sourceBytes), sourceHash
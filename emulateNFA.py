@@ -1,10 +1,35 @@
 import NFA as automaton
+import cacheNFA
 import sys
 import os
 
 # python3 emulateNFA.py NFAfile inputFile OPTIONAL(1/0) 
+#   NFAfile can be a comma separated list of definition files (a.txt,b.txt,...) - all of them are run over the input
+#   in a single pass, and a result is printed for every one of them
 #                                           1 - all intermediate steps printed to the output
 #                                           0 - only accepted/rejected printed to the screen
+# options (anywhere in the command line, starting with --):
+#   --batch     every line of the input file is a separate input string, the NFA is parsed only once
+#   --summary   with --batch, only the number of accepted/rejected/invalid strings is printed
+#   --workers=N     with --batch, the input strings are run on N worker processes
+#   --chunk-size=N  number of input strings sent to a worker at a time (1000 by default)
+#   --vectorized    with --batch, the input strings are run in batches with numpy (see vectorNFA.py)
+#   --shared-prefixes   with --batch, the lines are sorted (in blocks) so that common prefixes are run only once
+#                   (a single NFA, not with --workers, --vectorized or --trace)
+#   --unordered     with --workers, results are printed as soon as they are ready, prefixed by their line number
+#   --scan[=all/first/count]  reports the substrings of the input accepted by the NFA instead of accepting the whole
+#                   input - every match as "start end" (symbol positions, end excluded), only the first one, or their number
+#   --reduce        the NFA is reduced before running (unreachable/dead states, epsilon transitions, equivalent states)
+#   --stats         prints the time spent in every phase and the widest steps (number of active states) of the run
+#                   (a single run of one NFA - not with --batch, --scan or several definition files)
+#   --trace=FILE    the active states after every step are written to FILE (step, symbol, state ids - see StepTrace)
+#   --trace-every=N     with --trace, only every Nth step is written
+#   --trace-last=K      with --trace, only the last K steps of rejected inputs are written
+#   --early-exit    stops reading the input as soon as the result can't change anymore, and prints how many symbols
+#                   were read (the rest of the input isn't checked against the alphabet) - a single quiet run of one
+#                   NFA only, not with --batch, --scan, --stats, --trace or verbosity
+#   --no-cache      always parse the definition file, without reading or writing its binary cache (see cacheNFA.py)
+# an input file named - reads the input from stdin
 class NFAFileNotFoundError(Exception):
     pass
 
@@ -14,6 +39,9 @@ class NotEnoughArgummentsError(Exception):
 class DirectoryNotFoundError(Exception):
     pass
 
+class OptionError(Exception):
+    pass
+
 def changeDirectory(directoryPath):
     # safely changes the current working directory to the specified target directory.
 
@@ -24,6 +52,36 @@ def changeDirectory(directoryPath):
     else:
         raise DirectoryNotFoundError(f"Error: Directory '{directoryPath}' does not exist.")
 
+def getOptionValue(options, optionName, defaultValue):
+    # value of an option given as --name=value, or defaultValue if the option isn't present
+    for option in options:
+        if option.startswith(optionName + "="):
+            return option[len(optionName) + 1:]
+    return defaultValue
+
+def openInputFile(fileName):
+    # "-" stands for the standard input, so input strings can be piped into the script
+    if fileName == "-":
+        return sys.stdin
+    return open(fileName, "r")
+
+# options are taken out of the argument list first, so the positional arguments keep their places
+options = [argument for argument in sys.argv[1:] if argument.startswith("--")]
+sys.argv = [argument for argument in sys.argv if not argument.startswith("--")]
+batchMode = "--batch" in options
+summaryOnly = "--summary" in options
+workerCount = int(getOptionValue(options, "--workers", 0)) # 0 - no worker processes
+chunkSize = int(getOptionValue(options, "--chunk-size", 1000))
+orderedResults = "--unordered" not in options
+vectorized = "--vectorized" in options
+sharedPrefixes = "--shared-prefixes" in options
+useCache = "--no-cache" not in options
+reduceNfas = "--reduce" in options
+showStats = "--stats" in options
+traceFileName = getOptionValue(options, "--trace", None)
+earlyExit = "--early-exit" in options
+scanMode = getOptionValue(options, "--scan", "all" if "--scan" in options else None)
+
 # support for IDE running script
 # easily modifiable to make more modular -
 # currently we are using two subfolders to be more organised - one with all the .nfa files
@@ -33,10 +91,10 @@ inputFolder = "Input Files"
 if len(sys.argv) == 1:
     try:
         changeDirectory(nfaDefinitionFolder)
-        inputNfaFile = open(input("Give NFA Definition file name: "), "r")
+        inputNfaFiles = [open(fileName.strip(), "r") for fileName in input("Give NFA Definition file name: ").split(",")]
         os.chdir("..")
         changeDirectory(inputFolder)
-        inputStringFile = open(input("Give input file name: "), "r")
+        inputStringFile = openInputFile(input("Give input file name: "))
         os.chdir("..")
         allowVerbosity = bool(int(input("Want to output all steps taken by the NFA? (Input 1/0) ")))
         stringInput = input("What separator is used between the symbols in the input file? (Space -> ' ', NoSeparator -> '', ; -> ';', etc.) ")
@@ -57,10 +115,10 @@ elif len(sys.argv) == 2:
 else:     
     try:
         changeDirectory(nfaDefinitionFolder)
-        inputNfaFile = open(sys.argv[1], "r")
+        inputNfaFiles = [open(fileName.strip(), "r") for fileName in sys.argv[1].split(",")]
         os.chdir("..")
         changeDirectory(inputFolder)
-        inputStringFile = open(sys.argv[2], "r")
+        inputStringFile = openInputFile(sys.argv[2])
         os.chdir("..")
         if len(sys.argv) == 4: 
             allowVerbosity = bool(int(sys.argv[3])) # 1 or 0 if i want all intermediate steps printed to the output or not
@@ -84,17 +142,151 @@ else:
         raise NFAFileNotFoundError(f"NFA input file not found in current directory {os.getcwd()}") 
     
     
-nfa = automaton.parseFile(inputNfaFile)
-inputNfaFile.close()
+# the definition files were opened inside the definition folder - the cache needs their paths from the project folder
+nfas = []
+for inputNfaFile in inputNfaFiles:
+    nfaFileName = os.path.join(nfaDefinitionFolder, inputNfaFile.name)
+    inputNfaFile.close()
+    nfas.append(cacheNFA.loadNfa(nfaFileName, useCache)) # parsed and validated only if the binary cache is missing or out of date
+if reduceNfas:
+    nfas = [automaton.reduceNfa(nfa, printReport = False) for nfa in nfas]
+nfa = nfas[0]
+nfaNames = [inputNfaFile.name for inputNfaFile in inputNfaFiles]
+
+def getResultText(result):
+    if result == True:
+        return "Accepted"
+    if result == False:
+        return "Rejected"
+    return "Invalid" # symbols not in the alphabet of the NFA
+
+if len(nfas) > 1 and (workerCount > 0 or vectorized or scanMode is not None):
+    raise OptionError("--workers, --vectorized and --scan can only be used with a single NFA definition file")
+if showStats and (batchMode or len(nfas) > 1 or scanMode is not None):
+    raise OptionError("--stats can only be used with a single NFA definition file, without --batch or --scan")
+if sharedPrefixes and (workerCount > 0 or vectorized or len(nfas) > 1 or traceFileName is not None):
+    raise OptionError("--shared-prefixes can't be used with several NFA definition files, --workers, --vectorized or --trace")
+if earlyExit and (batchMode or len(nfas) > 1 or scanMode is not None or showStats or traceFileName is not None or
+                  allowVerbosity):
+    raise OptionError("--early-exit can only be used for a single run of one NFA definition file, without --batch, "
+                      "--scan, --stats, --trace or verbosity")
+trace = None
+if traceFileName is not None:
+    if len(nfas) > 1 or workerCount > 0 or vectorized or scanMode is not None:
+        raise OptionError("--trace can't be used with several NFA definition files, --workers, --vectorized or --scan")
+    traceEvery = int(getOptionValue(options, "--trace-every", 1))
+    traceLast = getOptionValue(options, "--trace-last", None)
+    if traceEvery < 1 or (traceLast is not None and int(traceLast) < 1):
+        raise OptionError("--trace-every and --trace-last must be at least 1")
+    trace = automaton.StepTrace(traceFileName, traceEvery, None if traceLast is None else int(traceLast),
+                                onlyRejected = traceLast is not None)
+
+def getTracedResults(inputLines):
+    # runNfaBatch with every run recorded in the trace
+    for inputLine in inputLines:
+        try:
+            yield automaton.runNfa(nfa, inputLine, stringSeparator, False, trace = trace)
+        except automaton.InputStringError:
+            yield None
 # automaton.printNfaDataStructures(nfa)
 # print()
-inputString = inputStringFile.read()
-inputStringFile.close()
+if batchMode:
+    # the input file is streamed line by line - only one input string is in memory at a time
+    resultCounts = [{"Accepted" : 0, "Rejected" : 0, "Invalid" : 0} for nfa in nfas]
+    inputLines = (line.rstrip("\n") for line in inputStringFile)
+    if len(nfas) > 1:
+        multiNFA = automaton.MultiNFA(nfas) # every line is split into symbols once for all the NFAs
+        results = (multiNFA.run(inputLine, stringSeparator) for inputLine in inputLines)
+    elif workerCount > 0:
+        import parallelNFA
+        results = parallelNFA.runNfaParallel(nfa, inputLines, stringSeparator, workerCount, chunkSize, orderedResults)
+    elif trace is not None:
+        results = getTracedResults(inputLines)
+    elif vectorized:
+        import vectorNFA
+        results = vectorNFA.runNfaVectorized(nfa, inputLines, stringSeparator)
+    elif sharedPrefixes:
+        results = automaton.runNfaPrefixShared(nfa, inputLines, stringSeparator)
+    else:
+        results = automaton.runNfaBatch(nfa, inputLines, stringSeparator, allowVerbosity)
+    for result in results:
+        linePrefix = ""
+        if not orderedResults and workerCount > 0:
+            lineIndex, result = result
+            linePrefix = f"{lineIndex + 1}: "
+        lineResults = result if len(nfas) > 1 else [result]
+        resultTexts = [getResultText(lineResult) for lineResult in lineResults]
+        for counts, resultText in zip(resultCounts, resultTexts):
+            counts[resultText] += 1
+        if not summaryOnly:
+            sys.stdout.write(linePrefix + ", ".join(resultTexts) + "\n") # one result per NFA, in command line order
+    inputStringFile.close()
+    if summaryOnly:
+        for nfaName, counts in zip(nfaNames, resultCounts):
+            if len(nfas) > 1:
+                print(f"{nfaName}")
+            print(f"Accepted : {counts['Accepted']}")
+            print(f"Rejected : {counts['Rejected']}")
+            print(f"Invalid : {counts['Invalid']}")
+
+elif scanMode is not None:
+    # the input is streamed, and the matches are printed as soon as their last symbol is read
+    matches = automaton.scanNfaStream(nfa, inputStringFile, stringSeparator)
+    if scanMode == "count":
+        print(f"Matches : {sum(1 for match in matches)}")
+    elif scanMode == "first":
+        firstMatch = next(matches, None)
+        print("No match" if firstMatch is None else f"{firstMatch[0]} {firstMatch[1]}")
+    else:
+        for start, end in matches:
+            sys.stdout.write(f"{start} {end}\n")
+    inputStringFile.close()
+
+elif len(nfas) > 1:
+    if allowVerbosity:
+        inputString = inputStringFile.read()
+        results = []
+        for nfaName, multiNfa in zip(nfaNames, nfas):
+            print(nfaName)
+            try:
+                results.append(automaton.runNfa(multiNfa, inputString, stringSeparator, allowVerbosity))
+            except automaton.InputStringError:
+                results.append(None)
+    else:
+        # one pass over the input for all the NFAs
+        results = automaton.MultiNFA(nfas).runStream(inputStringFile, stringSeparator)
+    inputStringFile.close()
+
+    for nfaName, result in zip(nfaNames, results):
+        print(f"{nfaName} : {getResultText(result)}")
 
-if automaton.runNfa(nfa, inputString, stringSeparator, allowVerbosity) == True:
-    print("Accepted")
 else:
-    print("Rejected")
+    stats = None
+    if showStats or trace is not None:
+        if showStats:
+            stats = automaton.RunStats(recordSteps = False)
+        accepted = automaton.runNfa(nfa, inputStringFile.read(), stringSeparator, allowVerbosity, stats, trace)
+    elif allowVerbosity:
+        inputString = inputStringFile.read()
+        accepted = automaton.runNfa(nfa, inputString, stringSeparator, allowVerbosity)
+    elif earlyExit:
+        accepted, consumedCount = automaton.runNfaStreamEarlyExit(nfa, inputStringFile, stringSeparator)
+    else:
+        # the input is read in chunks and split into symbols while the NFA runs - memory stays flat for any input size
+        accepted = automaton.runNfaStream(nfa, inputStringFile, stringSeparator)
+    inputStringFile.close()
+
+    if accepted == True:
+        print("Accepted")
+    else:
+        print("Rejected")
+    if stats is not None:
+        stats.printReport()
+    elif earlyExit:
+        print(f"Symbols consumed : {consumedCount}")
+
+if trace is not None:
+    trace.close()
 
 # automaton.generateDefinitionNFAFile(nfa)
 # automaton.convertNFAtoDFA(nfa)
@@ -0,0 +1,202 @@
+import NFA as automaton
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from itertools import islice
+
+# running many input strings through the same NFA on several processor cores
+# the NFA is sent to every worker process only once, when the worker starts (initializer), and compiled there -
+# the tasks themselves only carry chunks of input strings
+
+workerLazyDFA = None # set in every worker process by initialiseWorker
+
+def initialiseWorker(NFA):
+    global workerLazyDFA
+    workerLazyDFA = automaton.getLazyDFA(NFA)
+
+def runChunk(inputStrings, stringSeparator):
+    # runs in a worker process - same results as runNfaBatch: True, False or None (symbols not in the alphabet)
+    results = []
+    for inputString in inputStrings:
+        try:
+            results.append(workerLazyDFA.run(inputString, stringSeparator))
+        except automaton.InputStringError:
+            results.append(None)
+    return results
+
+def getChunks(inputStrings, chunkSize):
+    # splits any iterable into lists of at most chunkSize strings, without reading it all in memory
+    inputStrings = iter(inputStrings)
+    while True:
+        chunk = list(islice(inputStrings, chunkSize))
+        if not chunk:
+            return
+        yield chunk
+
+def getProcessContext():
+    # fork is used where it exists - with spawn every worker would import the main script again, and emulateNFA.py
+    # runs its whole command line handling at import time
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+def runNfaParallel(NFA, inputStrings, stringSeparator, workers = None, chunkSize = 1000, ordered = True):
+    # runs the NFA on every input string using a pool of worker processes
+    # ordered = True  - yields the results in the same order as the input strings
+    # ordered = False - yields (index, result) pairs as soon as their chunk is done
+    # workers = None uses one process per processor core
+    # only a few chunks per worker are in flight at a time, so the input can be a file of any size
+    if not automaton.isNfaValid(NFA):
+        raise automaton.NFAError("NFA not valid")
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    maxChunksInFlight = 2 * workers # enough to keep every worker busy while the results are being consumed
+
+    with ProcessPoolExecutor(max_workers = workers, mp_context = getProcessContext(),
+                             initializer = initialiseWorker, initargs = (NFA,)) as executor:
+        chunks = getChunks(inputStrings, chunkSize)
+        chunkStartIndex = 0
+
+        if ordered:
+            pendingChunks = deque() # futures in input order
+            for chunk in chunks:
+                pendingChunks.append(executor.submit(runChunk, chunk, stringSeparator))
+                if len(pendingChunks) >= maxChunksInFlight:
+                    yield from pendingChunks.popleft().result()
+            while pendingChunks:
+                yield from pendingChunks.popleft().result()
+
+        else:
+            pendingChunks = {} # future -> index of the first string of its chunk
+            for chunk in chunks:
+                pendingChunks[executor.submit(runChunk, chunk, stringSeparator)] = chunkStartIndex
+                chunkStartIndex += len(chunk)
+                if len(pendingChunks) >= maxChunksInFlight:
+                    doneChunks, notDoneChunks = wait(pendingChunks, return_when = FIRST_COMPLETED)
+                    for future in doneChunks:
+                        startIndex = pendingChunks.pop(future)
+                        for offset, result in enumerate(future.result()):
+                            yield startIndex + offset, result
+            for future in as_completed(list(pendingChunks)):
+                startIndex = pendingChunks.pop(future)
+                for offset, result in enumerate(future.result()):
+                    yield startIndex + offset, result
+
+# one huge input string, split in chunks that are run in parallel
+# every step of the NFA is a union over the active states, so the effect of a whole chunk is known once the states
+# reached from every single state are known - the chunks are run speculatively from every state that could be active,
+# and the mappings found are then composed in order, starting from the start state
+# the speculative runs are grouped by their current state set: runs that reach the same set are merged, so in
+# practice after a few symbols there are only one or a few sets left to step, not one per state
+
+def getChunkImages(inputChunk, stringSeparator, startMasks):
+    # runs in a worker process - returns, for every mask in startMasks, the mask reached after the whole chunk
+    states, symbolIndex, transitionMasks, startMask, acceptMask = workerLazyDFA.compiledNFA
+    getRow = workerLazyDFA.getRow
+    groups = {} # current mask -> positions in startMasks of the runs that are in it
+    for position, statesMask in enumerate(startMasks):
+        groups.setdefault(statesMask, []).append(position)
+
+    for currentSymbol in automaton.splitIncludingNoSeparator(inputChunk, stringSeparator):
+        if currentSymbol not in symbolIndex:
+            raise automaton.InputStringError("Input string contains symbols not in the given alphabet of the NFA")
+        symbolId = symbolIndex[currentSymbol]
+        nextGroups = {}
+        for statesMask, positions in groups.items():
+            row = getRow(statesMask) # the DFA states cached by the worker make repeated sets cheap
+            nextMask = row[symbolId]
+            if nextMask is None:
+                nextMask = row[symbolId] = automaton.stepMask(statesMask, transitionMasks[symbolId])
+            if nextMask in nextGroups:
+                nextGroups[nextMask].extend(positions) # two runs reached the same set - from now on they are one
+            else:
+                nextGroups[nextMask] = positions
+        groups = nextGroups
+
+    images = [0] * len(startMasks)
+    for statesMask, positions in groups.items():
+        for position in positions:
+            images[position] = statesMask
+    return images
+
+def separatorCanOverlap(separator):
+    # true if the separator can overlap with itself (e.g. "aa" in "aaa"), in which case looking for it from
+    # the middle of the string may not find the same occurrences as str.split
+    return any(separator[:length] == separator[-length:] for length in range(1, len(separator)))
+
+def getInputChunks(inputString, stringSeparator, chunkCount):
+    # splits the input string in about chunkCount pieces, only at separator positions, so that splitting every piece
+    # gives exactly the symbols of the whole string, in order
+    if stringSeparator == "":
+        chunkLength = -(-len(inputString) // chunkCount) or 1 # rounded up
+        return [inputString[index : index + chunkLength] for index in range(0, len(inputString), chunkLength)] or [""]
+    if separatorCanOverlap(stringSeparator):
+        symbols = inputString.split(stringSeparator)
+        chunkLength = -(-len(symbols) // chunkCount)
+        return [stringSeparator.join(symbols[index : index + chunkLength]) for index in range(0, len(symbols), chunkLength)]
+
+    chunks = []
+    chunkLength = -(-len(inputString) // chunkCount) or 1
+    chunkStartIndex = 0
+    while True:
+        separatorIndex = inputString.find(stringSeparator, chunkStartIndex + chunkLength)
+        if separatorIndex == -1: # last chunk
+            chunks.append(inputString[chunkStartIndex:])
+            return chunks
+        chunks.append(inputString[chunkStartIndex : separatorIndex])
+        chunkStartIndex = separatorIndex + len(stringSeparator)
+
+def getReachableMask(compiledNFA):
+    # all the states that can be active at some point, starting from the start state
+    states, symbolIndex, transitionMasks, startMask, acceptMask = compiledNFA
+    reachableMask = startMask
+    statesToVisit = startMask
+    while statesToVisit:
+        lowestBit = statesToVisit & -statesToVisit
+        stateId = lowestBit.bit_length() - 1
+        statesToVisit ^= lowestBit
+        for symbolMasks in transitionMasks:
+            newStates = symbolMasks[stateId] & ~reachableMask
+            reachableMask |= newStates
+            statesToVisit |= newStates
+    return reachableMask
+
+def runNfaChunked(NFA, inputString, stringSeparator, workers = None, chunkCount = None):
+    # same result as runNfa(NFA, inputString, stringSeparator, False), with the input processed in parallel chunks
+    # the first chunk is run only from the start state, the others from every reachable state
+    if not automaton.isNfaValid(NFA):
+        raise automaton.NFAError("NFA not valid")
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if chunkCount is None:
+        chunkCount = workers
+
+    compiledNFA = automaton.getCompiledNfa(NFA)
+    states, symbolIndex, transitionMasks, startMask, acceptMask = compiledNFA
+    inputChunks = getInputChunks(inputString.strip(), stringSeparator, chunkCount)
+
+    reachableMask = getReachableMask(compiledNFA)
+    reachableStateIds = []
+    statesMask = reachableMask
+    while statesMask:
+        lowestBit = statesMask & -statesMask
+        reachableStateIds.append(lowestBit.bit_length() - 1)
+        statesMask ^= lowestBit
+    singleStateMasks = [1 << stateId for stateId in reachableStateIds]
+
+    with ProcessPoolExecutor(max_workers = workers, mp_context = getProcessContext(),
+                             initializer = initialiseWorker, initargs = (NFA,)) as executor:
+        firstChunk = executor.submit(getChunkImages, inputChunks[0], stringSeparator, [startMask])
+        otherChunks = [executor.submit(getChunkImages, inputChunk, stringSeparator, singleStateMasks)
+                       for inputChunk in inputChunks[1:]]
+
+        currentMask = firstChunk.result()[0]
+        for future in otherChunks: # composing the chunk mappings in order
+            images = future.result()
+            nextMask = 0
+            for stateId, image in zip(reachableStateIds, images):
+                if currentMask >> stateId & 1:
+                    nextMask |= image
+            currentMask = nextMask
+
+    return currentMask & acceptMask != 0
@@ -0,0 +1,198 @@
+import NFA as automaton
+import cacheNFA
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# registry of automata by definition file name, for programs serving many of them (e.g. serverNFA.py)
+# a definition file is only loaded (through the binary cache of cacheNFA.py) and compiled the first time it is asked for,
+# and the loaded automata are kept in least recently used order under a memory budget - when the estimated size of
+# all of them goes over it, the least recently used ones are dropped, and loaded again if they are asked for later
+# every automaton remembers the modification time, size and SHA-256 hash of its file; at most every checkInterval
+# seconds a request stats the file, and if it was modified and its hash changed the automaton is loaded again
+# (a file that was only touched is not reloaded) - plain polling, so it works the same on every OS
+
+DEFINITION_FOLDER = "NFA Definition Files"
+
+class RegistryError(Exception):
+    pass
+
+class RegistryEntry:
+    # a loaded automaton - NFA is a ValidatedNFA, compiled and with its lazy DFA cache, and lock guards that cache,
+    # which isn't thread safe
+    # mtimeNs, fileSize and fileHash describe the exact contents the NFA was built from (see cacheNFA.loadNfaFromSource)
+    # a reload makes a new entry, so the users of the old one can finish with the automaton they started with
+    def __init__(self, name, NFA, mtimeNs, fileSize, fileHash, checkTime):
+        self.name = name
+        self.NFA = NFA
+        self.lock = threading.Lock()
+        self.mtimeNs = mtimeNs
+        self.fileSize = fileSize
+        self.fileHash = fileHash
+        self.checkTime = checkTime # last time the file was compared to this entry
+        self.staticSize = getStaticSize(NFA) # measured once - only the lazy DFA cache grows after loading
+        self.rowSize = getRowSize(NFA)
+        self.memorySize = 0 # last value of getMemorySize, as counted in the registry's total
+
+    def getMemorySize(self):
+        # cheap - called on every request
+        return self.staticSize + len(self.NFA.lazyDFA.rows) * self.rowSize
+
+def getMaskSize(NFA):
+    return sys.getsizeof(1 << len(NFA[0])) # every mask is an int about as wide as the number of states
+
+def getStaticSize(NFA):
+    # rough number of bytes held by a loaded NFA, without its lazy DFA cache: its names and rules and its compiled
+    # transition masks - goes through all the rules, so it is only computed when the NFA is loaded
+    states, sigma, rules, start, accept = NFA
+    size = sum(sys.getsizeof(name) for name in states) + sum(sys.getsizeof(symbol) for symbol in sigma)
+    size += sys.getsizeof(rules)
+    for stateRules in rules.values():
+        size += sys.getsizeof(stateRules) + sum(sys.getsizeof(destinationStates) for destinationStates in stateRules.values())
+    size += len(sigma) * (sys.getsizeof([None] * len(states)) + len(states) * getMaskSize(NFA))
+    return size
+
+def getRowSize(NFA):
+    # rough number of bytes of a DFA state memoized by the lazy DFA cache - its row, its key and the masks in its row
+    sigma = NFA[1]
+    return sys.getsizeof([None] * len(sigma)) + (len(sigma) + 1) * getMaskSize(NFA)
+
+class AutomatonRegistry:
+    # memoryBudget  - bytes (estimated) that the loaded automata can take, None for no limit - the automaton being
+    #                 returned is never dropped, so a single one bigger than the budget still works
+    # checkInterval - seconds between two checks of the same definition file, 0 checks it on every request
+    # hits, misses (loads), evictions and reloads count what the registry did since it was created
+    # loading and checking the files happen outside the registry's lock, so a slow parse only holds up the requests
+    # for that file - and if the file was already loaded they keep getting the loaded automaton meanwhile
+    def __init__(self, folder = DEFINITION_FOLDER, memoryBudget = None, checkInterval = 1.0, useCache = True):
+        self.folder = folder
+        self.memoryBudget = memoryBudget
+        self.checkInterval = checkInterval
+        self.useCache = useCache
+        self.entries = OrderedDict() # name -> RegistryEntry, least recently used first
+        self.loaders = {}            # name -> Future of the load or check in progress for that file
+        self.memorySize = 0          # estimated size of all the entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reloads = 0
+
+    def getFileName(self, name):
+        # only names of files directly inside the folder - a request can't read anything else
+        if name in ("", ".", "..") or os.path.basename(name) != name:
+            raise RegistryError(f"Invalid definition file name {name!r}")
+        return os.path.join(self.folder, name)
+
+    def load(self, name, checkTime):
+        try:
+            NFA, mtimeNs, fileSize, fileHash = cacheNFA.loadNfaFromSource(self.getFileName(name), self.useCache)
+        except FileNotFoundError:
+            raise RegistryError(f"Definition file {name} not found in {self.folder}")
+        automaton.getLazyDFA(NFA) # compiled now, not by the first run
+        return RegistryEntry(name, NFA, mtimeNs, fileSize, fileHash, checkTime)
+
+    def isOutOfDate(self, entry):
+        # true if the definition file has new contents - a new modification time with the same hash only updates the entry
+        fileName = self.getFileName(entry.name)
+        try:
+            fileStatus = os.stat(fileName)
+            if fileStatus.st_mtime_ns == entry.mtimeNs and fileStatus.st_size == entry.fileSize:
+                return False
+            if fileStatus.st_size == entry.fileSize and cacheNFA.getFileHash(fileName) == entry.fileHash:
+                entry.mtimeNs = fileStatus.st_mtime_ns
+                return False
+        except FileNotFoundError:
+            pass # loading it again reports the missing file
+        return True
+
+    def refresh(self, name, entry, checkTime):
+        # runs outside the lock - the entry to use from now on: the same one if its file didn't change, a new one otherwise
+        if entry is not None and not self.isOutOfDate(entry):
+            return entry
+        return self.load(name, checkTime)
+
+    def get(self, name):
+        # the RegistryEntry of a definition file, loaded or reloaded if needed
+        self.getFileName(name)
+        currentTime = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(name)
+            loader = self.loaders.get(name)
+            if entry is not None and (loader is not None or currentTime - entry.checkTime < self.checkInterval):
+                self.useEntry(entry) # checked recently, or being checked by another thread
+                return entry
+            isLoader = loader is None
+            if isLoader:
+                loader = self.loaders[name] = Future()
+        if not isLoader: # another thread is loading the file - its result (or error) is this one's too
+            newEntry = loader.result()
+            with self.lock:
+                self.hits += 1
+            return newEntry
+
+        try:
+            newEntry = self.refresh(name, entry, currentTime)
+        except BaseException as error:
+            with self.lock:
+                del self.loaders[name]
+                if entry is not None and self.entries.get(name) is entry: # the file is gone or can't be parsed anymore
+                    self.removeEntry(name)
+            loader.set_exception(error)
+            raise
+        with self.lock:
+            del self.loaders[name]
+            if newEntry is entry:
+                entry.checkTime = currentTime
+                if name not in self.entries: # evicted while it was being checked
+                    self.addEntry(entry)
+                self.useEntry(entry)
+            else:
+                if name in self.entries:
+                    self.removeEntry(name)
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.reloads += 1
+                self.addEntry(newEntry)
+                self.evictEntries()
+        loader.set_result(newEntry)
+        return newEntry
+
+    def useEntry(self, entry):
+        # a hit - the entry becomes the most recently used, and its size is updated for its lazy DFA cache's growth
+        self.hits += 1
+        self.entries.move_to_end(entry.name)
+        memorySize = entry.getMemorySize()
+        self.memorySize += memorySize - entry.memorySize
+        entry.memorySize = memorySize
+        self.evictEntries()
+
+    def addEntry(self, entry):
+        entry.memorySize = entry.getMemorySize()
+        self.entries[entry.name] = entry
+        self.memorySize += entry.memorySize
+
+    def removeEntry(self, name):
+        entry = self.entries.pop(name)
+        self.memorySize -= entry.memorySize
+
+    def evictEntries(self):
+        # drops the least recently used entries until the rest fit in the budget (the most recent one always stays)
+        if self.memoryBudget is None:
+            return
+        while self.memorySize > self.memoryBudget and len(self.entries) > 1:
+            self.removeEntry(next(iter(self.entries)))
+            self.evictions += 1
+
+    def getNames(self):
+        # names of the loaded automata, least recently used first
+        with self.lock:
+            return list(self.entries)
+
+    def printReport(self):
+        print(f"loaded : {len(self.entries)}, estimated size : {self.memorySize} bytes")
+        print(f"hits : {self.hits}, misses : {self.misses}, evictions : {self.evictions}, reloads : {self.reloads}")
@@ -0,0 +1,265 @@
+import NFA as automaton
+import registryNFA
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# resident matching service - the definition files are loaded (parsed, or read from the binary cache) once and kept in
+# a registry (see registryNFA.py - loaded on first use, reloaded when they change, least recently used ones dropped
+# under a memory budget), and clients send their input strings over a local socket instead of starting emulateNFA.py for every
+# check, so the automata are compiled once and their lazy DFA caches stay warm for all the clients
+#
+# python3 serverNFA.py OPTIONAL(names) [options]
+#   names           comma separated definition files loaded at startup - the others are loaded on first use
+# options:
+#   --host=H --port=N   TCP address to listen on (127.0.0.1 and 8765 by default)
+#   --unix=PATH         listens on a Unix socket instead
+#   --threads=N         threads running the automata (4 by default)
+#   --max-pending=N     jobs waiting for or running on the threads at most, over all connections (64 by default) -
+#                       a connection doesn't read its next request while the queue is full, so a fast client is
+#                       slowed down by its socket instead of the server's memory growing
+#   --memory-budget=MB  estimated memory the loaded automata can take, no limit by default
+#   --check-interval=S  seconds between two checks of a definition file for changes (1 by default)
+#   --no-cache          always parse the definition files (see cacheNFA.py)
+#
+# protocol - UTF-8 lines, one request per line, answered by one line (N lines for BATCH):
+#   SEP separator       separator of the symbols on this connection: SPACE, NOSEPARATOR (the default) or the
+#                       separator itself -> OK
+#   LOAD name           loads a definition file from the definition folder -> OK name stateCount symbolCount
+#   MATCH name input    -> Accepted, Rejected or Invalid (symbols not in the alphabet of the NFA)
+#   BATCH name N        followed by N lines, each a separate input string -> N results, in order (ERROR lines for
+#                       inputs that couldn't be run, e.g. N of them if the definition file can't be loaded) - if N
+#                       is missing or not a number, a single ERROR line and the lines that follow are read as requests
+#   SESSION name        starts the streaming session of the connection (replacing the previous one) -> OK
+#   FEED input          more symbols for the session -> Accepted or Rejected for everything fed so far, or Invalid,
+#                       in which case nothing from that line was consumed
+#   RESET               the session goes back to the start state -> OK
+#   END                 ends the session -> Accepted or Rejected
+#   LIST                loaded definition files, comma separated
+#   STATS               -> loaded N size B hits H misses M evictions E reloads R (counters of the registry)
+#   QUIT                closes the connection
+# a request that fails is answered with "ERROR message" and the connection stays open
+#
+# the lazy DFA cache of an automaton is shared by all the connections, but it isn't thread safe (every step reorders
+# its rows), so every run holds the lock of its automaton - different automata still run at the same time, and the
+# event loop itself never runs an automaton, so it keeps serving the other connections
+
+DEFAULT_PORT = 8765
+MAX_LINE_LENGTH = 64 << 20  # bytes - longer requests are refused and the connection is closed
+BATCH_CHUNK_SIZE = 1000     # lines of a BATCH sent to a thread at a time
+BATCH_CHUNKS_IN_FLIGHT = 2  # per connection - the next chunk is read while the previous one runs
+
+class ProtocolError(Exception):
+    pass
+
+def getSeparator(separatorName):
+    # same names as on the emulateNFA.py command line
+    if separatorName.upper() == "SPACE":
+        return " "
+    if separatorName.upper() == "NOSEPARATOR":
+        return ""
+    return separatorName
+
+def getErrorText(error):
+    # the reply to a failed request, on one line - the messages of this project's errors are clear enough on their own
+    if isinstance(error, (registryNFA.RegistryError, ProtocolError, automaton.NFAError, UnicodeDecodeError)):
+        message = str(error)
+    else:
+        message = f"{type(error).__name__}: {error}"
+    return "ERROR " + message.replace("\n", " ")
+
+def getResultText(result):
+    if result == True:
+        return "Accepted"
+    if result == False:
+        return "Rejected"
+    return "Invalid" # symbols not in the alphabet of the NFA
+
+# jobs - they run on the threads, each holding the lock of its automaton
+
+def loadAutomaton(registry, name):
+    NFA = registry.get(name).NFA
+    return f"OK {name} {len(NFA[0])} {len(NFA[1])}"
+
+def matchStrings(registry, name, inputStrings, stringSeparator):
+    # result texts of input strings, like emulateNFA.py --batch
+    entry = registry.get(name)
+    lazyDFA = automaton.getLazyDFA(entry.NFA)
+    resultTexts = []
+    with entry.lock:
+        for inputString in inputStrings:
+            try:
+                resultTexts.append(getResultText(lazyDFA.run(inputString, stringSeparator)))
+            except automaton.InputStringError:
+                resultTexts.append("Invalid")
+    return resultTexts
+
+def startSession(registry, name, stringSeparator):
+    # the session keeps the automaton it started with, even if the file is reloaded in the meantime
+    entry = registry.get(name)
+    return automaton.NFASession(entry.NFA, stringSeparator, automaton.getLazyDFA(entry.NFA)), entry.lock
+
+def feedSession(session, lock, inputChunk):
+    with lock:
+        try:
+            session.feed(inputChunk.strip())
+        except automaton.InputStringError:
+            return "Invalid"
+    return getResultText(session.isAccepting())
+
+class NFAServer:
+    def __init__(self, registry, threadCount = 4, maxPendingJobs = 64):
+        self.registry = registry
+        self.executor = ThreadPoolExecutor(max_workers = threadCount)
+        self.maxPendingJobs = maxPendingJobs
+        self.pendingJobs = None # semaphore - made in serve, inside the event loop
+
+    async def runJob(self, job, *arguments):
+        # waits for a free place in the queue, then runs the job on a thread
+        async with self.pendingJobs:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, job, *arguments)
+
+    async def serve(self, host = "127.0.0.1", port = DEFAULT_PORT, unixPath = None):
+        self.pendingJobs = asyncio.Semaphore(self.maxPendingJobs)
+        if unixPath is not None:
+            server = await asyncio.start_unix_server(self.handleConnection, unixPath, limit = MAX_LINE_LENGTH)
+            print(f"Listening on {unixPath}")
+        else:
+            server = await asyncio.start_server(self.handleConnection, host, port, limit = MAX_LINE_LENGTH)
+            print(f"Listening on {host}:{port}")
+        sys.stdout.flush()
+        async with server:
+            await server.serve_forever()
+
+    async def handleConnection(self, reader, writer):
+        connection = {"separator" : "", "session" : None} # state of this connection only
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError: # longer than MAX_LINE_LENGTH
+                    writer.write(b"ERROR Request too long\n")
+                    break
+                if not line:
+                    break
+                try:
+                    request = line.decode("utf-8").rstrip("\r\n")
+                    command, space, argument = request.partition(" ")
+                    command = command.upper()
+                    if command == "QUIT":
+                        break
+                    elif command == "BATCH":
+                        await self.runBatch(reader, writer, connection, argument)
+                    else:
+                        reply = await self.handleRequest(connection, command, argument)
+                        writer.write(reply.encode("utf-8") + b"\n")
+                except ConnectionError:
+                    raise
+                except Exception as error: # e.g. a definition file that can't be parsed - the connection stays open
+                    writer.write(getErrorText(error).encode("utf-8") + b"\n")
+                await writer.drain() # waits while the client isn't reading its replies
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handleRequest(self, connection, command, argument):
+        if command == "SEP":
+            connection["separator"] = getSeparator(argument)
+            return "OK"
+        if command == "LOAD":
+            return await self.runJob(loadAutomaton, self.registry, argument)
+        if command == "MATCH":
+            name, space, inputString = argument.partition(" ")
+            resultTexts = await self.runJob(matchStrings, self.registry, name, [inputString], connection["separator"])
+            return resultTexts[0]
+        if command == "SESSION":
+            connection["session"] = await self.runJob(startSession, self.registry, argument, connection["separator"])
+            return "OK"
+        if command == "LIST":
+            return ",".join(self.registry.getNames())
+        if command == "STATS":
+            registry = self.registry
+            return (f"loaded {len(registry.entries)} size {registry.memorySize} hits {registry.hits} "
+                    f"misses {registry.misses} evictions {registry.evictions} reloads {registry.reloads}")
+        if command in ("FEED", "RESET", "END"):
+            if connection["session"] is None:
+                raise ProtocolError(f"{command} without a SESSION")
+            session, lock = connection["session"]
+            if command == "FEED":
+                return await self.runJob(feedSession, session, lock, argument)
+            if command == "RESET":
+                session.reset() # only the session's own mask - no lock needed
+                return "OK"
+            connection["session"] = None
+            return getResultText(session.isAccepting())
+        raise ProtocolError(f"Unknown command {command}")
+
+    async def runBatch(self, reader, writer, connection, argument):
+        # the input lines are read and run in chunks, with the results of a chunk written as soon as it is done -
+        # neither the lines nor the results of the whole batch are kept in memory
+        # a BATCH line without a number of lines can't say how many lines follow it - it is answered with one ERROR
+        # line and none are skipped, so the lines after it are read as requests
+        name, space, lineCount = argument.partition(" ")
+        if not lineCount.isdigit():
+            raise ProtocolError("BATCH needs a definition file name and a number of lines")
+        remainingLines = int(lineCount)
+        try:
+            await self.runJob(loadAutomaton, self.registry, name)
+        except Exception as error:
+            # the lines are still read, so the next request is found, and each one is answered with the error
+            errorText = getErrorText(error).encode("utf-8") + b"\n"
+            while remainingLines > 0:
+                if not await reader.readline():
+                    raise ConnectionError("Connection closed in the middle of a batch")
+                writer.write(errorText)
+                remainingLines -= 1
+                if remainingLines % BATCH_CHUNK_SIZE == 0:
+                    await writer.drain()
+            return
+        pendingChunks = []
+        while remainingLines > 0 or pendingChunks:
+            if remainingLines > 0 and len(pendingChunks) < BATCH_CHUNKS_IN_FLIGHT:
+                chunk = []
+                while remainingLines > 0 and len(chunk) < BATCH_CHUNK_SIZE:
+                    line = await reader.readline()
+                    if not line:
+                        raise ConnectionError("Connection closed in the middle of a batch")
+                    chunk.append(line.decode("utf-8", "replace").rstrip("\r\n"))
+                    remainingLines -= 1
+                pendingChunks.append((asyncio.ensure_future(self.runJob(matchStrings, self.registry, name, chunk,
+                                                                        connection["separator"])), len(chunk)))
+                continue
+            chunkResults, chunkLength = pendingChunks.pop(0)
+            try:
+                resultTexts = await chunkResults
+            except Exception as error: # e.g. the file was changed into one that can't be parsed - still one line per input
+                resultTexts = [getErrorText(error)] * chunkLength
+            writer.write(("\n".join(resultTexts) + "\n").encode("utf-8"))
+            await writer.drain()
+
+if __name__ == "__main__":
+    def getOptionValue(options, optionName, defaultValue):
+        for option in options:
+            if option.startswith(optionName + "="):
+                return option[len(optionName) + 1:]
+        return defaultValue
+
+    options = [argument for argument in sys.argv[1:] if argument.startswith("--")]
+    arguments = [argument for argument in sys.argv[1:] if not argument.startswith("--")]
+    memoryBudget = getOptionValue(options, "--memory-budget", None)
+    registry = registryNFA.AutomatonRegistry(registryNFA.DEFINITION_FOLDER,
+                                             None if memoryBudget is None else int(float(memoryBudget) * (1 << 20)),
+                                             float(getOptionValue(options, "--check-interval", 1.0)),
+                                             "--no-cache" not in options)
+    if arguments:
+        for name in arguments[0].split(","):
+            loadAutomaton(registry, name.strip())
+    server = NFAServer(registry, int(getOptionValue(options, "--threads", 4)),
+                       int(getOptionValue(options, "--max-pending", 64)))
+    try:
+        asyncio.run(server.serve(getOptionValue(options, "--host", "127.0.0.1"),
+                                 int(getOptionValue(options, "--port", DEFAULT_PORT)),
+                                 getOptionValue(options, "--unix", None)))
+    except KeyboardInterrupt:
+        pass
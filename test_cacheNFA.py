@@ -0,0 +1,68 @@
+import cacheNFA
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+# python3 -m unittest test_cacheNFA (or python3 -m pytest)
+
+definitionFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NFA Definition Files")
+
+class DamagedCacheTest(unittest.TestCase):
+    # a cache file that can't be read must only cost a parse - loadNfa rebuilds it instead of raising
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.definitionFileName = os.path.join(self.folder, "epsilonNFA.txt")
+        shutil.copy(os.path.join(definitionFolder, "epsilonNFA.txt"), self.definitionFileName)
+        self.expectedNFA = tuple(cacheNFA.loadNfa(self.definitionFileName, useCache = False))
+        cacheNFA.loadNfa(self.definitionFileName) # writes the cache
+        self.cacheFileName = cacheNFA.getCacheFileName(self.definitionFileName)
+        with open(self.cacheFileName, "rb") as file:
+            self.cacheBytes = file.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def writeCacheFile(self, cacheBytes):
+        # the header (source modification time and size) is kept, so the damaged cache still looks up to date
+        with open(self.cacheFileName, "wb") as file:
+            file.write(cacheBytes)
+
+    def assertRebuilt(self):
+        self.assertEqual(tuple(cacheNFA.loadNfa(self.definitionFileName)), self.expectedNFA)
+        with open(self.cacheFileName, "rb") as file:
+            self.assertEqual(file.read(), self.cacheBytes)
+        self.assertEqual(tuple(cacheNFA.loadNfa(self.definitionFileName)), self.expectedNFA) # from the new cache
+
+    def testTruncatedCacheIsRebuilt(self):
+        for length in range(cacheNFA.HEADER_SIZE, len(self.cacheBytes)):
+            with self.subTest(length = length):
+                self.writeCacheFile(self.cacheBytes[:length])
+                self.assertRebuilt()
+
+    def testWrongSectionSizesAreRebuilt(self):
+        # a header whose counts don't match the sections that follow it
+        header = list(struct.unpack_from(cacheNFA.HEADER_FORMAT, self.cacheBytes))
+        for field in (5, 6, 8, 9, 10, 11, 12, 13): # stateCount ... maskRowLength, except startId - any value in range is valid
+            for change in (-1, 1):
+                with self.subTest(field = field, change = change):
+                    damagedHeader = list(header)
+                    damagedHeader[field] = max(damagedHeader[field] + change, 0)
+                    self.writeCacheFile(struct.pack(cacheNFA.HEADER_FORMAT, *damagedHeader) +
+                                        self.cacheBytes[cacheNFA.HEADER_SIZE:])
+                    self.assertRebuilt()
+
+    def testOutOfRangeStateIdIsRebuilt(self):
+        # the first accept state id points past the last state
+        header = struct.unpack_from(cacheNFA.HEADER_FORMAT, self.cacheBytes)
+        stateCount, symbolCount = header[5], header[6]
+        acceptIdsPosition = cacheNFA.HEADER_SIZE + 4 * ((stateCount + 1) + (symbolCount + 1))
+        damagedBytes = bytearray(self.cacheBytes)
+        damagedBytes[acceptIdsPosition : acceptIdsPosition + 4] = b"\xff" * 4
+        self.writeCacheFile(bytes(damagedBytes))
+        self.assertRebuilt()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import NFA as automaton
+import contextlib
+import io
+import itertools
+import os
+import unittest
+
+# python3 -m unittest test_convertNFA (or python3 -m pytest)
+
+definitionFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NFA Definition Files")
+MAX_INPUT_LENGTH = 8 # every input string up to this length is checked
+
+def getSampleNfas():
+    # (file name, ValidatedNFA) of every definition file in the folder
+    for fileName in sorted(os.listdir(definitionFolder)):
+        if fileName.endswith(".txt"):
+            with open(os.path.join(definitionFolder, fileName), "r") as definitionFile:
+                yield fileName, automaton.parseFile(definitionFile)
+
+def getInputStrings(sigma, maxLength = MAX_INPUT_LENGTH):
+    for length in range(maxLength + 1):
+        for symbols in itertools.product(sigma, repeat = length):
+            yield "".join(symbols)
+
+def getExpectedResult(NFA, inputString):
+    # the set-based runNfa with its steps printed - the reference the other engines are compared against
+    with contextlib.redirect_stdout(io.StringIO()):
+        return automaton.runNfa(NFA, inputString, "", True)
+
+class DFAConversionTest(unittest.TestCase):
+    # the DFA has to accept exactly the strings its NFA accepts, minimized or not
+
+    def assertSameLanguage(self, NFA, DFA):
+        for inputString in getInputStrings(NFA[1]):
+            self.assertEqual(automaton.runNfa(DFA, inputString, "", False), getExpectedResult(NFA, inputString),
+                             inputString)
+
+    def testSampleDefinitionsConvert(self):
+        for fileName, NFA in getSampleNfas():
+            for minimize in (True, False):
+                with self.subTest(fileName = fileName, minimize = minimize):
+                    DFA = automaton.convertNFAtoDFA(NFA, minimize, printReport = False)
+                    states, sigma, rules, start, accept = DFA
+                    for state in states: # one destination for every state and symbol, no epsilon transitions
+                        self.assertEqual(sorted(rules.get(state, {})), sorted(sigma) if state in rules else [])
+                        for destinationStates in rules.get(state, {}).values():
+                            self.assertEqual(len(destinationStates), 1)
+                    self.assertSameLanguage(NFA, DFA)
+
+    def testMinimizationNeverAddsStates(self):
+        for fileName, NFA in getSampleNfas():
+            with self.subTest(fileName = fileName):
+                minimizedDFA = automaton.convertNFAtoDFA(NFA, True, printReport = False)
+                DFA = automaton.convertNFAtoDFA(NFA, False, printReport = False)
+                self.assertLessEqual(len(minimizedDFA[0]), len(DFA[0]))
+
+    def testEmptyLanguageKeepsAnAcceptState(self):
+        # no accept state can be reached - the DFA still needs one to be a valid NFA, and accepts nothing
+        NFA = automaton.ValidatedNFA((["q0", "q1"], ["a", "b"], {"q0" : {"a" : {"q0"}, "b" : {"q0"}}}, "q0", ["q1"]))
+        DFA = automaton.convertNFAtoDFA(NFA, printReport = False)
+        self.assertTrue(DFA[4])
+        self.assertSameLanguage(NFA, DFA)
+
+if __name__ == "__main__":
+    unittest.main()
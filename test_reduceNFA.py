@@ -0,0 +1,107 @@
+import NFA as automaton
+import contextlib
+import io
+import itertools
+import os
+import random
+import unittest
+
+# python3 -m unittest test_reduceNFA (or python3 -m pytest)
+
+definitionFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NFA Definition Files")
+MAX_INPUT_LENGTH = 7 # every input string up to this length is checked
+
+REDUCTION_PASSES = [automaton.removeUnreachableStates, automaton.removeDeadStates,
+                    automaton.removeEpsilonTransitions, automaton.mergeBisimilarStates]
+
+# small automata for the cases where a missing rule ("stay in the same state") makes a pass easy to get wrong
+EDGE_CASE_NFAS = {
+    # the only rule on a is to a dead state - dropping it would make q0 stay where it is and accept "a"
+    "ruleToDeadState" : (["q0", "q1"], ["a", "b"], {"q0" : {"a" : {"q1"}, "b" : {"q0"}}}, "q0", ["q0"]),
+    # q1 has no rules, so once reached through epsilon it stays accepting whatever follows
+    "epsilonToStateWithoutRules" : (["q0", "q1", "q2"], ["a", "b"],
+                                    {"q0" : {"epsilon" : {"q1"}, "a" : {"q2"}}}, "q0", ["q1"]),
+    # q0 has no rule on b - it stays, while its epsilon successor moves
+    "epsilonFromStateWithMissingRule" : (["q0", "q1", "q2"], ["a", "b"],
+                                         {"q0" : {"epsilon" : {"q1"}, "a" : {"q0"}},
+                                          "q1" : {"b" : {"q2"}}, "q2" : {"a" : {"q1"}}}, "q0", ["q2"]),
+    # an epsilon cycle, and a state only reachable through it
+    "epsilonCycle" : (["q0", "q1", "q2", "q3"], ["a", "b"],
+                      {"q0" : {"epsilon" : {"q1"}, "a" : {"q0"}, "b" : {"q0"}}, "q1" : {"epsilon" : {"q0", "q2"}},
+                       "q2" : {"a" : {"q3"}, "b" : {"q2"}}, "q3" : {"a" : {"q3"}, "b" : {"q2"}}}, "q0", ["q3"]),
+    # the accept state can't be reached - the language is empty
+    "emptyLanguage" : (["q0", "q1"], ["a", "b"], {"q0" : {"a" : {"q0"}, "b" : {"q0"}}}, "q0", ["q1"]),
+}
+
+def getSampleNfas():
+    # (name, ValidatedNFA) of every definition file in the folder and of the edge cases above
+    for fileName in sorted(os.listdir(definitionFolder)):
+        if fileName.endswith(".txt"):
+            with open(os.path.join(definitionFolder, fileName), "r") as definitionFile:
+                yield fileName, automaton.parseFile(definitionFile)
+    for name, NFA in EDGE_CASE_NFAS.items():
+        yield name, automaton.ValidatedNFA(NFA)
+
+def getRandomNfa(randomGenerator, stateCount = 5):
+    # some states without rules, some symbols without rules, epsilon rules included
+    states = [f"q{stateIndex}" for stateIndex in range(stateCount)]
+    rules = {}
+    for state in states:
+        if randomGenerator.random() < 0.2:
+            continue
+        stateRules = {}
+        for symbol in ("a", "b", "epsilon"):
+            if randomGenerator.random() < 0.6:
+                stateRules[symbol] = set(randomGenerator.sample(states, randomGenerator.randint(1, 2)))
+        if stateRules:
+            rules[state] = stateRules
+    accept = randomGenerator.sample(states, randomGenerator.randint(1, 2))
+    return automaton.ValidatedNFA((states, ["a", "b"], rules, states[0], accept))
+
+def getInputStrings(sigma, maxLength = MAX_INPUT_LENGTH):
+    for length in range(maxLength + 1):
+        for symbols in itertools.product(sigma, repeat = length):
+            yield "".join(symbols)
+
+def getExpectedResults(NFA):
+    # the set-based runNfa with its steps printed - the reference the reduced automata are compared against
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [automaton.runNfa(NFA, inputString, "", True) for inputString in getInputStrings(NFA[1])]
+
+class ReductionTest(unittest.TestCase):
+    # every pass, and all of them together, have to keep the accepted strings the same
+
+    def assertSameLanguage(self, NFA, reducedNFA, expectedResults):
+        for inputString, expectedResult in zip(getInputStrings(NFA[1]), expectedResults):
+            self.assertEqual(automaton.runNfa(reducedNFA, inputString, "", False), expectedResult, inputString)
+
+    def assertReductionsKeepLanguage(self, NFA):
+        expectedResults = getExpectedResults(NFA)
+        for reductionPass in REDUCTION_PASSES:
+            with self.subTest(reductionPass = reductionPass.__name__):
+                self.assertSameLanguage(NFA, reductionPass(NFA), expectedResults)
+        with self.subTest(reductionPass = "reduceNfa"):
+            reducedNFA = automaton.reduceNfa(NFA, printReport = False)
+            self.assertSameLanguage(NFA, reducedNFA, expectedResults)
+            self.assertLessEqual(len(reducedNFA[0]), len(NFA[0]) + 1) # at most a sink state more
+
+    def testSampleNfas(self):
+        for name, NFA in getSampleNfas():
+            with self.subTest(name = name):
+                self.assertReductionsKeepLanguage(NFA)
+
+    def testRandomNfas(self):
+        randomGenerator = random.Random(17)
+        for nfaIndex in range(40):
+            NFA = getRandomNfa(randomGenerator)
+            with self.subTest(nfaIndex = nfaIndex):
+                self.assertReductionsKeepLanguage(NFA)
+
+    def testEpsilonTransitionsAreRemoved(self):
+        for name, NFA in getSampleNfas():
+            with self.subTest(name = name):
+                rules = automaton.removeEpsilonTransitions(NFA)[2]
+                self.assertFalse(any("epsilon" in stateRules for stateRules in rules.values()))
+
+if __name__ == "__main__":
+    unittest.main()
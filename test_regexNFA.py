@@ -0,0 +1,62 @@
+import NFA as automaton
+import itertools
+import re
+import unittest
+
+# python3 -m unittest test_regexNFA (or python3 -m pytest)
+
+MAX_INPUT_LENGTH = 6 # every input string up to this length is checked
+
+# (expression, the same expression for the re module, alphabet)
+EXPRESSIONS = [
+    ("a", "a", "ab"),
+    ("ab", "ab", "ab"),
+    ("a|b", "a|b", "ab"),
+    ("a*", "a*", "ab"),
+    ("a+b?", "a+b?", "ab"),
+    ("(ab)*", "(ab)*", "ab"),
+    ("(a|b)*abb", "(a|b)*abb", "ab"),
+    ("a(b|ε)a", "a(b|)a", "ab"),
+    ("(a|)b", "(a|)b", "ab"),
+    ("((a|b)(a|b))*", "((a|b)(a|b))*", "ab"),
+    ("(a*b*)*c", "(a*b*)*c", "abc"),
+    ("a??b+*", "(a?)?(b+)*", "ab"),
+    ("", "", "ab"),
+    ("ε", "", "ab"),
+    ("a\\*b", "a\\*b", "ab*"),
+    ("\\(a\\)|\\\\", "\\(a\\)|\\\\", "()a\\"),
+]
+
+def getInputStrings(sigma, maxLength = MAX_INPUT_LENGTH):
+    for length in range(maxLength + 1):
+        for symbols in itertools.product(sigma, repeat = length):
+            yield "".join(symbols)
+
+class RegexConversionTest(unittest.TestCase):
+    # the Thompson NFA of an expression has to accept exactly the strings re.fullmatch matches
+
+    def testExpressionsMatchLikeRe(self):
+        for expression, pattern, sigma in EXPRESSIONS:
+            with self.subTest(expression = expression):
+                NFA = automaton.convertRegextoNFA(expression, sigma)
+                compiledPattern = re.compile(pattern)
+                for inputString in getInputStrings(sigma):
+                    self.assertEqual(automaton.runNfa(NFA, inputString, "", False),
+                                     compiledPattern.fullmatch(inputString) is not None, inputString)
+
+    def testAlphabetDefaultsToTheSymbolsUsed(self):
+        NFA = automaton.convertRegextoNFA("(b|a)*c")
+        self.assertEqual(list(NFA[1]), ["b", "a", "c"])
+
+    def testInvalidExpressionsAreRejected(self):
+        for expression in ("*a", "a|+", "(a", "a)", "a\\", "(a|b"):
+            with self.subTest(expression = expression):
+                with self.assertRaises(automaton.RegexError):
+                    automaton.convertRegextoNFA(expression, "ab")
+        with self.assertRaises(automaton.RegexError): # a symbol that isn't in the given alphabet
+            automaton.convertRegextoNFA("ab", "a")
+        with self.assertRaises(automaton.UndefinedAlphabetError): # no symbols and no alphabet
+            automaton.convertRegextoNFA("ε")
+
+if __name__ == "__main__":
+    unittest.main()
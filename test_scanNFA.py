@@ -0,0 +1,78 @@
+import NFA as automaton
+import contextlib
+import io
+import itertools
+import os
+import random
+import unittest
+
+# python3 -m unittest test_scanNFA (or python3 -m pytest)
+
+definitionFolder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NFA Definition Files")
+MAX_INPUT_LENGTH = 6 # every input string up to this length is scanned
+
+def getSampleNfas():
+    # (file name, ValidatedNFA) of every definition file in the folder
+    for fileName in sorted(os.listdir(definitionFolder)):
+        if fileName.endswith(".txt"):
+            with open(os.path.join(definitionFolder, fileName), "r") as definitionFile:
+                yield fileName, automaton.parseFile(definitionFile)
+
+def getInputStrings(sigma, maxLength = MAX_INPUT_LENGTH):
+    for length in range(maxLength + 1):
+        for symbols in itertools.product(sigma, repeat = length):
+            yield list(symbols)
+
+def getExpectedMatches(NFA, symbols):
+    # every non-empty substring run on its own with the set-based runNfa, by end and then by start
+    matches = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for end in range(1, len(symbols) + 1):
+            for start in range(end):
+                if automaton.runNfa(NFA, " ".join(symbols[start:end]), " ", True):
+                    matches.append((start, end))
+    return matches
+
+class ScanTest(unittest.TestCase):
+    # a scan has to report exactly the substrings runNfa accepts, in one pass
+
+    def assertScansLikeRunNfa(self, NFA, symbols):
+        expectedMatches = getExpectedMatches(NFA, symbols)
+        self.assertEqual(list(automaton.scanNfa(NFA, "".join(symbols), "")), expectedMatches, symbols)
+        if symbols: # like runNfa, an empty input with a separator is a single empty symbol, which isn't in the alphabet
+            self.assertEqual(list(automaton.scanNfa(NFA, " ".join(symbols), " ")), expectedMatches, symbols)
+        self.assertEqual(automaton.countMatches(NFA, "".join(symbols), ""), len(expectedMatches), symbols)
+        self.assertEqual(automaton.findFirstMatch(NFA, "".join(symbols), ""),
+                         expectedMatches[0] if expectedMatches else None, symbols)
+
+    def testEverySubstringOfShortInputs(self):
+        for fileName, NFA in getSampleNfas():
+            with self.subTest(fileName = fileName):
+                for symbols in getInputStrings(NFA[1]):
+                    self.assertScansLikeRunNfa(NFA, symbols)
+
+    def testLongerRandomInputs(self):
+        randomGenerator = random.Random(15)
+        for fileName, NFA in getSampleNfas():
+            with self.subTest(fileName = fileName):
+                for inputIndex in range(20):
+                    symbols = [randomGenerator.choice(NFA[1]) for symbolIndex in range(randomGenerator.randint(7, 30))]
+                    self.assertScansLikeRunNfa(NFA, symbols)
+
+    def testStreamScanMatchesScan(self):
+        # chunks as small as one character, so matches span chunk boundaries
+        randomGenerator = random.Random(16)
+        for fileName, NFA in getSampleNfas():
+            inputString = "".join(randomGenerator.choice(NFA[1]) for symbolIndex in range(200))
+            for chunkSize in (1, 7, 1 << 20):
+                with self.subTest(fileName = fileName, chunkSize = chunkSize):
+                    self.assertEqual(list(automaton.scanNfaStream(NFA, io.StringIO(inputString), "", chunkSize)),
+                                     list(automaton.scanNfa(NFA, inputString, "")))
+
+    def testSymbolOutsideTheAlphabetIsRejected(self):
+        fileName, NFA = next(getSampleNfas())
+        with self.assertRaises(automaton.InputStringError):
+            list(automaton.scanNfa(NFA, NFA[1][0] + "#", ""))
+
+if __name__ == "__main__":
+    unittest.main()
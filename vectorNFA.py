@@ -0,0 +1,137 @@
+import NFA as automaton
+from itertools import islice
+
+try:
+    import numpy
+except ImportError: # numpy is only needed by this module - the rest of the project runs without it
+    numpy = None
+
+# running many short input strings through the same NFA in lockstep with numpy
+# the strings of a batch are encoded as a 2-D array of symbol ids (one row per string, shorter strings padded), and
+# the state sets of all the strings are the rows of a matrix of 64-bit words - bit i of a row set <=> state i active
+# one step of the NFA is then the same few numpy operations for the whole batch: the rows are cut in small groups of
+# bits, and every group is looked up in a precomputed table giving the union of the destination masks of the states
+# in it (for the symbol of that string) - the tables are built from the compiled NFA, so the epsilon closure is
+# already folded in, exactly as in runCompiled
+# the padding symbol has an extra table that maps every set to itself, so padded strings simply stop moving
+
+MAX_TABLE_SIZE = 64 * 1024 * 1024 # bytes - the groups of bits get smaller for big automata to stay under this
+
+def requireNumpy():
+    if numpy is None:
+        raise ImportError("vectorNFA needs numpy (pip install numpy)")
+
+def getMaskWords(statesMask, wordCount):
+    # splits a python int mask into wordCount 64-bit words, lowest word first
+    return [(statesMask >> (64 * wordIndex)) & 0xFFFFFFFFFFFFFFFF for wordIndex in range(wordCount)]
+
+def getGroupBits(stateCount, symbolCount):
+    # largest group size (in bits) whose lookup tables fit in MAX_TABLE_SIZE
+    wordCount = -(-stateCount // 64) or 1
+    for groupBits in (8, 4, 2, 1):
+        groupCount = -(-stateCount // groupBits)
+        if (symbolCount + 1) * groupCount * (1 << groupBits) * wordCount * 8 <= MAX_TABLE_SIZE:
+            return groupBits
+    return 1
+
+def getStepTables(compiledNFA):
+    # stepTables[symbolId, group, value] = words of the union of transitionMasks[symbolId][stateId] for every state
+    # whose bit is set in value, the value being the bits of group (states group * groupBits onwards)
+    # the last symbol id is the padding symbol - its tables give the value back, at the position of the group
+    requireNumpy()
+    states, symbolIndex, transitionMasks, startMask, acceptMask = compiledNFA
+    stateCount = len(states)
+    symbolCount = len(transitionMasks)
+    wordCount = -(-stateCount // 64) or 1
+    groupBits = getGroupBits(stateCount, symbolCount)
+    groupCount = -(-stateCount // groupBits)
+
+    stepTables = numpy.zeros((symbolCount + 1, groupCount, 1 << groupBits, wordCount), dtype = numpy.uint64)
+    for symbolId, symbolMasks in enumerate(transitionMasks + [[1 << stateId for stateId in range(stateCount)]]):
+        for group in range(groupCount):
+            firstStateId = group * groupBits
+            groupMasks = symbolMasks[firstStateId : firstStateId + groupBits]
+            unionMasks = [0] * (1 << groupBits)
+            for value in range(1, 1 << groupBits):
+                lowestBit = value & -value # every value is a smaller value plus its lowest bit
+                bitIndex = lowestBit.bit_length() - 1
+                bitMask = groupMasks[bitIndex] if bitIndex < len(groupMasks) else 0
+                unionMasks[value] = unionMasks[value ^ lowestBit] | bitMask
+            stepTables[symbolId, group] = [getMaskWords(unionMask, wordCount) for unionMask in unionMasks]
+    return stepTables, groupBits
+
+def isSingleCharacterAlphabet(symbolIndex):
+    # the fast encoding reads the code points of the strings directly - it needs one character per symbol,
+    # and the character "\0" can't be told apart from the padding numpy adds to shorter strings
+    return all(len(symbol) == 1 and symbol != "\0" for symbol in symbolIndex)
+
+def encodeStrings(inputStrings, stringSeparator, symbolIndex):
+    # symbolIds[row, position] = id of the symbol, or len(symbolIndex) (padding) after the end of the string
+    # invalidRows[row] is true if the string has symbols not in the alphabet - its row is all padding
+    paddingId = len(symbolIndex)
+    inputStrings = [inputString.strip() for inputString in inputStrings]
+
+    if stringSeparator == "" and isSingleCharacterAlphabet(symbolIndex):
+        # the whole batch is converted at once: a numpy array of fixed-width strings viewed as its code points
+        codePoints = numpy.array(inputStrings, dtype = str)
+        codePoints = codePoints.view(numpy.uint32).reshape(len(inputStrings), -1)
+        lookupTable = numpy.full(max(map(ord, symbolIndex), default = 0) + 1, -1, dtype = numpy.int32)
+        for symbol, symbolId in symbolIndex.items():
+            lookupTable[ord(symbol)] = symbolId
+        isInTable = codePoints < len(lookupTable)
+        symbolIds = numpy.where(isInTable, lookupTable[numpy.where(isInTable, codePoints, 0)], -1)
+        lengths = numpy.fromiter(map(len, inputStrings), dtype = numpy.intp, count = len(inputStrings))
+        symbolIds[numpy.arange(symbolIds.shape[1]) >= lengths[:, None]] = paddingId
+    else:
+        splitStrings = [list(automaton.splitIncludingNoSeparator(inputString, stringSeparator))
+                        for inputString in inputStrings]
+        symbolIds = numpy.full((len(splitStrings), max(map(len, splitStrings), default = 0)), paddingId,
+                               dtype = numpy.int32)
+        for row, symbols in enumerate(splitStrings):
+            symbolIds[row, :len(symbols)] = [symbolIndex.get(symbol, -1) for symbol in symbols]
+
+    invalidRows = (symbolIds < 0).any(axis = 1)
+    symbolIds[invalidRows] = paddingId
+    return symbolIds, invalidRows
+
+def runEncoded(symbolIds, stepTables, groupBits, startMask, acceptMask):
+    # runs every row of symbolIds at the same time - returns a boolean array, true for the accepted rows
+    symbolCount, groupCount, valueCount, wordCount = stepTables.shape
+    groupMask = numpy.uint64((1 << groupBits) - 1)
+    flatTables = stepTables.reshape(-1, wordCount) # row (symbolId * groupCount + group) * valueCount + value
+
+    statesWords = numpy.tile(numpy.array(getMaskWords(startMask, wordCount), dtype = numpy.uint64), (len(symbolIds), 1))
+    for position in range(symbolIds.shape[1]):
+        tableRows = symbolIds[:, position].astype(numpy.intp) * (groupCount * valueCount)
+        nextWords = numpy.zeros_like(statesWords)
+        for group in range(groupCount):
+            firstBit = group * groupBits
+            values = (statesWords[:, firstBit // 64] >> numpy.uint64(firstBit % 64)) & groupMask
+            nextWords |= flatTables[tableRows + group * valueCount + values.astype(numpy.intp)]
+        statesWords = nextWords
+
+    acceptWords = numpy.array(getMaskWords(acceptMask, wordCount), dtype = numpy.uint64)
+    return (statesWords & acceptWords).any(axis = 1)
+
+def runNfaVectorized(NFA, inputStrings, stringSeparator, batchSize = 65536):
+    # same results as runNfaBatch(NFA, inputStrings, stringSeparator): yields, in order, True (accepted),
+    # False (rejected) or None (the string has symbols not in the alphabet)
+    # the strings are read batchSize at a time, so the input can be an iterable of any size (e.g. an open file)
+    # strings of about the same length should be batched together - every string of a batch takes as many steps
+    # as the longest one
+    requireNumpy()
+    if not automaton.isNfaValid(NFA):
+        raise automaton.NFAError("NFA not valid")
+    compiledNFA = automaton.getCompiledNfa(NFA)
+    states, symbolIndex, transitionMasks, startMask, acceptMask = compiledNFA
+    stepTables, groupBits = getStepTables(compiledNFA)
+
+    inputStrings = iter(inputStrings)
+    while True:
+        batch = list(islice(inputStrings, batchSize))
+        if not batch:
+            return
+        symbolIds, invalidRows = encodeStrings(batch, stringSeparator, symbolIndex)
+        accepted = runEncoded(symbolIds, stepTables, groupBits, startMask, acceptMask)
+        for isAccepted, isInvalid in zip(accepted.tolist(), invalidRows.tolist()):
+            yield None if isInvalid else isAccepted